@@ -1,36 +1,87 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, BackgroundTasks, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, ORJSONResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-from typing import Optional, List
-from core import load_flexible_index, retrieve_flexible, build_flexible_prompt, filter_blockchain_from_response
-from qdrant_retrieval import retrieve_from_qdrant, get_qdrant_collection_info
-from llm import generate_answer
+from typing import Optional, List, Dict, Any, Tuple, AsyncIterator, Iterator
+from core import load_flexible_index, build_flexible_prompt_parts, filter_blockchain_from_response, index_to_gpu, embed_query, dedupe_results, rerank_results, FAISS_INDEX_PATH
+from qdrant_retrieval import get_qdrant_collection_info
+from retrievers import Retriever, QdrantRetriever, FaissRetriever
+import llm
+from llm import generate_answer, stream_answer
 from gemini_search import *
+import gemini_search
 from judge import judge_merge_answers
 from db.conversation_manager import (
-    start_conversation, add_user_message, add_assistant_message,
-    get_conversation_context, conversation_exists, get_conversation_summary,
+    start_conversation, resolve_conversation, record_turn, get_conversation_context, conversation_exists, get_conversation_summary,
     list_user_conversations, delete_conversation, update_conversation_title
 )
+from db.database import db
 from twitter_bot_integration import bot_manager
+from prefetch import prefetcher, PREFETCH_ENABLED
+from prompt_manager import managers as prompt_managers, PromptManager
+from cache import (
+    answer_cache, response_cache, semantic_cache, make_answer_key, make_response_key,
+    evidence_signature, SEMANTIC_CACHE_ENABLED, RESPONSE_CACHE_VERIFY_EVIDENCE
+)
+import asyncio
+import orjson
 import os
+import re
+import numpy as np
 
 # Configuration - use environment variable to choose vector DB
 USE_QDRANT = os.getenv("USE_QDRANT", "true").lower() == "true"  # Default to Qdrant
-INDEX_PATH = "../embeddings/vector_index_flexible.faiss"
+INDEX_PATH = FAISS_INDEX_PATH
 USE_HYBRID = os.getenv("USE_HYBRID", "true").lower() == "true"  # Enable hybrid RAG+Gemini by default
+# Web chunks for the judge (gemini_search.fetch_web_chunks); off by default while that helper is
+# commented out there, turn it on together with the helper
+WEB_SEARCH_ENABLED = USE_HYBRID and os.getenv("WEB_SEARCH_ENABLED", "false").lower() == "true"
+if WEB_SEARCH_ENABLED and not callable(getattr(gemini_search, "fetch_web_chunks", None)):
+    raise RuntimeError("WEB_SEARCH_ENABLED=true but gemini_search.fetch_web_chunks is not defined")
+# Largest page the database listing endpoints return per request
+PAGE_MAX_LIMIT = int(os.getenv("PAGE_MAX_LIMIT", "1000"))
+# Trailing partial word of streamed text (held back until complete, see _filtered_deltas)
+_TRAILING_WORD_RE = re.compile(r'\w*\Z')
+
+async def _warmup_retrieval():
+    """Embed a query and search the vector DB once (embedding TLS, Qdrant channel, FAISS kernels)."""
+    query = "What is Kaspa?"
+    query_embedding = await asyncio.to_thread(embed_query, query)
+    await retriever.search(query, query_embedding)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Pay cold-start costs (embedding + vector search, OpenAI TLS handshake) before serving requests."""
+    for name, result in zip(("Retrieval", "OpenAI client"),
+                            await asyncio.gather(_warmup_retrieval(), llm.warmup(), return_exceptions=True)):
+        if isinstance(result, Exception):
+            print(f"⚠️ {name} warmup failed: {result}")
+        else:
+            print(f"🔥 {name} warmed up")
+    yield
+    await retriever.close()
+    await llm.client.close()
+    db.pool.close()
 
-app = FastAPI(title="Kaspa Flexible RAG Chatbot")
+app = FastAPI(title="Kaspa Flexible RAG Chatbot", lifespan=lifespan, default_response_class=ORJSONResponse)
 
-# CORS for local dev frontend (Vite on 5173)
+# CORS: explicit origin allowlist (set-membership check per request); the wildcard is dev-only
+CORS_ORIGINS = frozenset(
+    origin.strip() for origin in os.getenv(
+        "CORS_ORIGINS",
+        # Local dev frontend (Vite on 5173) and the frontend container (serve on 3000);
+        # deployments list their public frontend origin (see docker-compose.yml, .env.example)
+        "http://localhost:5173,http://127.0.0.1:5173,http://0.0.0.0:5173,"
+        "http://localhost:3000,http://127.0.0.1:3000"
+    ).split(",") if origin.strip()
+)
+if os.getenv("ENV") == "dev":
+    CORS_ORIGINS = CORS_ORIGINS | {"*"}
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=[
-        "http://localhost:5173",
-        "http://127.0.0.1:5173",
-        "http://0.0.0.0:5173",
-        "*",  # relax during dev; tighten in production
-    ],
+    allow_origins=CORS_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -58,13 +109,17 @@ if not USE_QDRANT:
     # Load index & metadata at startup
     try:
         index, metadata = load_flexible_index(INDEX_PATH)
+        index = index_to_gpu(index)  # no-op on CPU-only hosts
         print(f"✅ Loaded flexible index with {len(metadata)} chunks")
-        print(f"📊 Sources: {metadata['source'].value_counts().to_dict()}")
+        print(f"📊 Sources: {metadata.source_counts()}")
     except Exception as e:
         print(f"❌ Error loading flexible index: {e}")
         print("Please run: python core.py (to create embeddings)")
         index, metadata = None, None
 
+# Every request retrieves through the same interface, whichever vector DB is in use
+retriever: Retriever = QdrantRetriever() if USE_QDRANT else FaissRetriever(index, metadata)
+
 class QueryRequest(BaseModel):
     question: str
     conversation_id: Optional[str] = None
@@ -78,64 +133,75 @@ class UpdateTitleRequest(BaseModel):
     conversation_id: str
     title: str
 
-@app.post("/ask")
-def ask_question(request: QueryRequest):
-    # Handle conversation context
-    conversation_id = request.conversation_id
-    if not conversation_id:
-        # TEMPORARY: Use static conversation ID for testing
-        # TODO: Replace with actual Twitter API conversation ID when integrated
-        conversation_id = "temp1234"
-        
-    elif not conversation_exists(conversation_id):
-        # Invalid conversation ID, use static one
-        # TEMPORARY: Using static ID for testing
-        conversation_id = "temp1234"
-    
-    # Ensure conversation exists in database
-    if not conversation_exists(conversation_id):
-        start_conversation(request.user_id or "temp_user", f"Conversation {conversation_id}", conversation_id)
-    
-    # Get conversation context for continuity
-    conversation_context = get_conversation_context(conversation_id, max_messages=8)
-    
-    # Add user message to conversation
-    add_user_message(conversation_id, request.question)
-    
-    # Step 1: Get RAG results from vector DB
-    rag_results = []
-    if USE_QDRANT:
-        # Use Qdrant for retrieval
-        try:
-            print(f"🔍 DEBUG: Starting Qdrant retrieval for: {request.question}")
-            rag_results = retrieve_from_qdrant(request.question, k=10)
-            
-            print(f"🔍 DEBUG: Retrieved {len(rag_results)} results from Qdrant")
-        except Exception as e:
-            print(f"🔍 DEBUG: Error in Qdrant processing: {str(e)}")
-            print(f"🔍 DEBUG: Exception type: {type(e).__name__}")
-            import traceback
-            print(f"🔍 DEBUG: Traceback: {traceback.format_exc()}")
+async def _retrieve_rag(question: str, query_embedding: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+    """Get RAG results from the configured vector DB ([] on failure)."""
+    try:
+        # The same text can be indexed under several files/sources; send it to the prompt once
+        rag_results = dedupe_results(await retriever.search(question, query_embedding))
+        print(f"🔍 DEBUG: Retrieved {len(rag_results)} results from {retriever.name}")
+        return rag_results
+    except Exception as e:
+        print(f"🔍 DEBUG: Error in {retriever.name} retrieval: {str(e)}")
+        print(f"🔍 DEBUG: Exception type: {type(e).__name__}")
+        import traceback
+        print(f"🔍 DEBUG: Traceback: {traceback.format_exc()}")
+        return []
+
+async def _search_web(question: str) -> List[Dict[str, Any]]:
+    """Get Gemini web search results ([] on failure)."""
+    try:
+        print(f"🔍 DEBUG: Starting Gemini web search for: {question}")
+        web_results = await asyncio.to_thread(gemini_search.fetch_web_chunks, question, k=5)
+        print(f"🔍 DEBUG: Retrieved {len(web_results)} results from Gemini web search")
+        return web_results
+    except Exception as e:
+        print(f"🔍 DEBUG: Error in Gemini web search: {str(e)}")
+        return []
+
+def _build_citations(results: List[Dict[str, Any]], citation_type: str = "rag") -> List[Dict[str, Any]]:
+    """Source citations for retrieved ("rag") or web search ("web") results."""
+    # Web results carry a date where RAG chunks carry a filename
+    extra_field = "date" if citation_type == "web" else "filename"
+    return [
+        {
+            "source": r["source"],
+            "section": r.get("section", ""),
+            extra_field: r.get(extra_field, ""),
+            "url": r.get("url", ""),
+            "score": r.get("score", 0),
+            "type": citation_type
+        }
+        for r in results
+    ]
+
+async def _gather_results(question: str, query_embedding: Optional[np.ndarray] = None,
+                          rag_results: Optional[List[Dict[str, Any]]] = None
+                          ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Get (rag_results, web_results) for a question."""
+    # Steps 1 and 2 run concurrently: RAG results from the vector DB (unless they are
+    # already known for this turn) and, in hybrid mode, Gemini web search results
+    if rag_results is not None:
+        web_results = await _search_web(question) if WEB_SEARCH_ENABLED else []
+    elif WEB_SEARCH_ENABLED:
+        rag_results, web_results = await asyncio.gather(
+            _retrieve_rag(question, query_embedding), _search_web(question)
+        )
     else:
-        # Use FAISS for retrieval (fallback)
-        if index is None or metadata is None:
-            print("❌ FAISS index not loaded")
-        else:
-            try:
-                rag_results = retrieve_flexible(request.question, index, metadata, k=5)
-                print(f"🔍 DEBUG: Retrieved {len(rag_results)} results from FAISS")
-            except Exception as e:
-                print(f"🔍 DEBUG: Error in FAISS retrieval: {str(e)}")
+        rag_results, web_results = await _retrieve_rag(question, query_embedding), []
+    return rag_results, web_results
+
+async def _answer_question(question: str, conversation_context: List[Dict[str, Any]],
+                           query_embedding: Optional[np.ndarray] = None,
+                           rag_results: Optional[List[Dict[str, Any]]] = None,
+                           web_results: Optional[List[Dict[str, Any]]] = None
+                           ) -> Tuple[str, List[Dict[str, Any]], bool, List[Dict[str, Any]]]:
+    """Retrieve context, optionally merge web results, and generate the answer.
     
-    # Step 2: Get Gemini web search results if hybrid mode is enabled
-    web_results = []
-    if USE_HYBRID:
-        try:
-            print(f"🔍 DEBUG: Starting Gemini web search for: {request.question}")
-            web_results = fetch_web_chunks(request.question, k=5)
-            print(f"🔍 DEBUG: Retrieved {len(web_results)} results from Gemini web search")
-        except Exception as e:
-            print(f"🔍 DEBUG: Error in Gemini web search: {str(e)}")
+    Returns (answer, citations, hybrid, rag_results). Pass both rag_results and
+    web_results to skip retrieval.
+    """
+    if rag_results is None or web_results is None:
+        rag_results, web_results = await _gather_results(question, query_embedding, rag_results)
     
     # Step 3: Determine how to proceed based on available results
     if not rag_results and not web_results:
@@ -147,35 +213,13 @@ def ask_question(request: QueryRequest):
         try:
             print(f"🔍 DEBUG: Using judge to merge {len(rag_results)} RAG and {len(web_results)} web results")
             # Judge will prefer web results when conflicts arise
-            raw_judge_answer = judge_merge_answers(request.question, rag_results, web_results)
+            raw_judge_answer = await asyncio.to_thread(judge_merge_answers, question, rag_results, web_results)
             # Filter out any "blockchain" references from the judge's response
             answer = filter_blockchain_from_response(raw_judge_answer)
             print(f"🔍 DEBUG: Judge produced answer: {answer[:100]}...")
             
             # Combine citations from both sources
-            citations = []
-            # Add RAG citations
-            for result in rag_results:
-                citation = {
-                    "source": result["source"],
-                    "section": result.get("section", ""),
-                    "filename": result.get("filename", ""),
-                    "url": result.get("url", ""),
-                    "score": result.get("score", 0),
-                    "type": "rag"
-                }
-                citations.append(citation)
-            # Add web citations
-            for result in web_results:
-                citation = {
-                    "source": result["source"],
-                    "section": result.get("section", ""),
-                    "url": result.get("url", ""),
-                    "date": result.get("date", ""),
-                    "score": result.get("score", 0),
-                    "type": "web"
-                }
-                citations.append(citation)
+            citations = _build_citations(rag_results) + _build_citations(web_results, "web")
         except Exception as e:
             print(f"🔍 DEBUG: Error in judge merging: {str(e)}")
             # Fall back to RAG-only if judge fails
@@ -188,62 +232,310 @@ def ask_question(request: QueryRequest):
     if not use_hybrid_local or (use_hybrid_local and not web_results):
         # Step 3b: Traditional RAG flow (no web results or hybrid disabled)
         try:
-            # Build prompt with conversation context
-            base_prompt = build_flexible_prompt(request.question, rag_results)
-          
-            system_message = base_prompt[0]  # System prompt
-            current_user_message = base_prompt[1]  # Current user message with context
-            
-            if conversation_context:
-                # Structure: system prompt + conversation history + current query with RAG context
-                messages = [system_message] + conversation_context + [current_user_message]
+            # Same question, same retrieved chunks and same history -> reuse the answer
+            cache_key = make_answer_key(question, rag_results, conversation_context)
+            answer = answer_cache.get(cache_key)
+            if answer is not None:
+                print(f"🔍 DEBUG: Answer cache hit: {answer[:100]}...")
             else:
-                messages = base_prompt
-            
-            print(f"🔍 DEBUG: About to call generate_answer with {len(messages)} messages")
-            raw_answer = generate_answer(messages)
-            # Filter out any "blockchain" references from the response
-            answer = filter_blockchain_from_response(raw_answer)
-            print(f"🔍 DEBUG: Generated answer: {answer[:100]}...")
+                # Build prompt with conversation context
+                # build_flexible_prompt_parts performs the (blocking) Gemini web search
+                system_message, context_message, question_message = await asyncio.to_thread(
+                    build_flexible_prompt_parts, question, rag_results
+                )
+
+                # Structure: static system prompt + conversation history + this turn's RAG context + question.
+                # Everything before the context is identical to the previous turn's prompt, so the
+                # provider's prompt prefix cache can reuse it.
+                messages = [system_message, *conversation_context, context_message, question_message]
+
+                print(f"🔍 DEBUG: About to call generate_answer with {len(messages)} messages")
+                raw_answer = await generate_answer(messages)
+                # Filter out any "blockchain" references from the response
+                answer = filter_blockchain_from_response(raw_answer)
+                answer_cache.set(cache_key, answer)
+                print(f"🔍 DEBUG: Generated answer: {answer[:100]}...")
             
             # Create source citations from the retrieved results
-            citations = []
-            for result in rag_results:
-                citation = {
-                    "source": result["source"],
-                    "section": result.get("section", ""),
-                    "filename": result.get("filename", ""),
-                    "url": result.get("url", ""),
-                    "score": result.get("score", 0),
-                    "type": "rag"
-                }
-                citations.append(citation)
+            citations = _build_citations(rag_results)
         except Exception as e:
             print(f"🔍 DEBUG: Error in RAG processing: {str(e)}")
             answer = f"Sorry, there was an error processing your question: {str(e)}"
             citations = []
     
-    # Step 4: Add assistant response to conversation
+    return answer, citations, use_hybrid_local, rag_results
+
+async def _prompt_manager(conversation_id: str, message_count: int) -> PromptManager:
+    """The conversation's in-memory history, (re)loaded from the database on first use or when
+    the stored conversation has changed behind it."""
+    manager = prompt_managers.current(conversation_id, message_count)
+    if manager is None:
+        manager = await asyncio.to_thread(
+            prompt_managers.hydrate, conversation_id, message_count, get_conversation_context
+        )
+    return manager
+
+async def _start_turn(request: QueryRequest) -> Tuple[str, List[Dict[str, Any]], str, Optional[np.ndarray]]:
+    """Resolve the conversation, load its context (and prefix hash) and embed the question."""
+    # Handle conversation context: a missing or unknown conversation ID falls back to the
+    # static one, which is created if needed (one database round trip)
+    # TEMPORARY: Use static conversation ID for testing
+    # TODO: Replace with actual Twitter API conversation ID when integrated
+    conversation_id, message_count = await asyncio.to_thread(
+        resolve_conversation, request.conversation_id, "temp1234", request.user_id or "temp_user"
+    )
+    
+    # Get conversation context for continuity, embedding the question concurrently
+    # (the embedding is needed for the semantic cache and reused for retrieval)
+    context_call = _prompt_manager(conversation_id, message_count)
+    if SEMANTIC_CACHE_ENABLED:
+        manager, query_embedding = await asyncio.gather(
+            context_call, asyncio.to_thread(embed_query, request.question), return_exceptions=True
+        )
+        if isinstance(manager, BaseException):
+            raise manager
+        if isinstance(query_embedding, BaseException):
+            print(f"🔍 DEBUG: Error embedding question: {str(query_embedding)}")
+            query_embedding = None
+    else:
+        manager, query_embedding = await context_call, None
+    # The committed history is byte-stable across turns; this turn is appended as a delta
+    conversation_context, prefix_hash = manager.messages(), manager.prefix_hash()
+    manager.append({"role": "user", "content": request.question})
+    
+    return conversation_id, conversation_context, prefix_hash, query_embedding
+
+async def _lookup_response(question: str, prefix_hash: str,
+                     query_embedding: Optional[np.ndarray]) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """Check the response caches; returns (response_key, cached response or None)."""
+    # Response caches, scoped to the conversation prefix (follow-ups depend on the history):
+    # exact repeat of the question first, then a paraphrase via the semantic cache
+    response_key = make_response_key(question, prefix_hash)
+    cached = response_cache.get(response_key)
+    if cached is not None:
+        print("🔍 DEBUG: Response cache hit")
+    elif query_embedding is not None:
+        # Flat scan over every cached embedding: keep it off the event loop
+        cached = await asyncio.to_thread(semantic_cache.lookup, query_embedding, prefix_hash)
+        if cached is not None:
+            print("🔍 DEBUG: Semantic cache hit")
+    return response_key, cached
+
+async def _verify_cached(cached: Optional[Dict[str, Any]], question: str, query_embedding: Optional[np.ndarray]
+                         ) -> Tuple[Optional[Dict[str, Any]], Optional[List[Dict[str, Any]]]]:
+    """Serve a cached response only if retrieval still returns the chunks it was generated from.
+    
+    Returns (cached response or None, rag_results if retrieval ran).
+    """
+    if cached is None or not RESPONSE_CACHE_VERIFY_EVIDENCE:
+        return cached, None
+    rag_results = await _retrieve_rag(question, query_embedding)
+    if evidence_signature(rag_results) != cached["evidence"]:
+        print("🔍 DEBUG: Cached response skipped, retrieved evidence changed")
+        return None, rag_results  # reused to answer, so the retrieval isn't wasted
+    return cached, rag_results
+
+async def _store_response(prefix_hash: str, response_key: str, query_embedding: Optional[np.ndarray],
+                    answer: str, citations: List[Dict[str, Any]], use_hybrid_local: bool,
+                    rag_results: List[Dict[str, Any]]):
+    """Remember a generated response in both cache tiers."""
+    # Only cache real answers (error/no-result paths have no citations)
+    if citations:
+        response = {"answer": answer, "citations": citations, "hybrid": use_hybrid_local,
+                    "evidence": evidence_signature(rag_results)}
+        response_cache.set(response_key, response)
+        if query_embedding is not None:
+            await asyncio.to_thread(semantic_cache.add, query_embedding, response, prefix_hash)
+
+def _take_prefetched(conversation_id: str, question: str,
+                     query_embedding: Optional[np.ndarray]) -> Optional[List[Dict[str, Any]]]:
+    """Retrieval results prefetched after the previous turn, if they fit this question (ranked for it)."""
+    if not PREFETCH_ENABLED:
+        return None
+    prefetched = prefetcher.take(conversation_id, query_embedding)
+    if prefetched is not None:
+        print("🔍 DEBUG: Using prefetched retrieval results")
+        prefetched = rerank_results(question, prefetched)
+    return prefetched
+
+async def _prefetch_next_turn(conversation_id: str, question: str, query_embedding: Optional[np.ndarray]):
+    """Background task: speculatively retrieve for the conversation's likely next question."""
+    if PREFETCH_ENABLED:
+        await prefetcher.prefetch(conversation_id, question, query_embedding, _retrieve_rag)
+
+def _finish_turn(conversation_id: str, answer: str):
+    """Add the assistant response to the in-memory conversation history."""
+    manager = prompt_managers.get(conversation_id)
+    if manager is not None:
+        manager.append({"role": "assistant", "content": answer})
+
+def _abandon_turn(conversation_id: str, question: str):
+    """Roll an unfinished turn's question back out of the in-memory conversation history."""
+    manager = prompt_managers.get(conversation_id)
+    if manager is not None and manager.discard_last({"role": "user", "content": question}):
+        print("🔍 DEBUG: Stream ended early, dropped the unanswered question from the history")
+
+async def _save_turn(conversation_id: str, question: str, answer: str, citations: List[Dict[str, Any]]):
+    """Background task: write the user message and assistant response in one transaction."""
     citation_metadata = {"citations": [{"source": c["source"], "type": c.get("type", "rag")} for c in citations]}
-    add_assistant_message(conversation_id, answer, citation_metadata)
+    if await asyncio.to_thread(record_turn, conversation_id, question, answer, citation_metadata):
+        prompt_managers.saved(conversation_id, 2)
+
+@app.post("/ask")
+async def ask_question(request: QueryRequest, background_tasks: BackgroundTasks):
+    conversation_id, conversation_context, prefix_hash, query_embedding = await _start_turn(request)
+    response_key, cached = await _lookup_response(request.question, prefix_hash, query_embedding)
+    cached, rag_results = await _verify_cached(cached, request.question, query_embedding)
+    
+    if cached is not None:
+        answer, citations, use_hybrid_local = cached["answer"], cached["citations"], cached["hybrid"]
+    else:
+        # The embedding computed for the cache lookup is reused for retrieval
+        if rag_results is None:
+            rag_results = _take_prefetched(conversation_id, request.question, query_embedding)
+        answer, citations, use_hybrid_local, rag_results = await _answer_question(
+            request.question, conversation_context, query_embedding, rag_results
+        )
+        await _store_response(prefix_hash, response_key, query_embedding, answer, citations, use_hybrid_local, rag_results)
+    
+    # Step 4: Add assistant response to conversation (saved to the database after the response is sent)
+    _finish_turn(conversation_id, answer)
+    background_tasks.add_task(_save_turn, conversation_id, request.question, answer, citations)
+    # While the user reads the answer, retrieve for where the conversation is heading
+    background_tasks.add_task(_prefetch_next_turn, conversation_id, request.question, query_embedding)
     
     # Return response
     return {
         "answer": answer,
         "citations": citations,
         "conversation_id": conversation_id,
-        "vector_db": "qdrant" if USE_QDRANT else "faiss",
+        "vector_db": retriever.name,
         "hybrid": use_hybrid_local
     }
 
+def _sse(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    """Format one Server-Sent Events frame."""
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {orjson.dumps(data).decode()}\n\n"
+
+async def _filtered_deltas(deltas) -> AsyncIterator[str]:
+    """Apply the blockchain -> BlockDAG filter to streamed text.
+    
+    The filter works on whole words, so a trailing partial word is held back
+    until the next delta (or the end of the stream) completes it.
+    """
+    pending = ""
+    async for delta in deltas:
+        pending += delta
+        cut = _TRAILING_WORD_RE.search(pending).start()
+        if cut:
+            yield filter_blockchain_from_response(pending[:cut])
+            pending = pending[cut:]
+    if pending:
+        yield filter_blockchain_from_response(pending)
+
+@app.post("/ask/stream")
+async def ask_question_stream(request: QueryRequest):
+    """Like /ask, but streams the answer as Server-Sent Events.
+    
+    Frames: `data: {"delta": ...}` for each piece of the answer, then
+    `event: done` with the citations and conversation id. The assistant
+    turn is saved after the stream finishes.
+    """
+    conversation_id, conversation_context, prefix_hash, query_embedding = await _start_turn(request)
+    response_key, cached = await _lookup_response(request.question, prefix_hash, query_embedding)
+    cached, rag_results = await _verify_cached(cached, request.question, query_embedding)
+    if cached is None and rag_results is None:
+        rag_results = _take_prefetched(conversation_id, request.question, query_embedding)
+    turn = {"answer": "", "citations": [], "completed": False}
+    
+    async def answer_events():
+        nonlocal rag_results
+        if cached is None:
+            # Web search first: only a judge merge (RAG and web results both present) has to be buffered
+            rag_results, web_results = await _gather_results(request.question, query_embedding, rag_results)
+        if cached is not None:
+            answer, citations, use_hybrid_local = cached["answer"], cached["citations"], cached["hybrid"]
+            yield _sse({"delta": answer})
+        elif USE_HYBRID and rag_results and web_results:
+            # The judge merges RAG and web answers in one call, so there is nothing to stream
+            answer, citations, use_hybrid_local, rag_results = await _answer_question(
+                request.question, conversation_context, query_embedding, rag_results, web_results
+            )
+            await _store_response(prefix_hash, response_key, query_embedding, answer, citations, use_hybrid_local, rag_results)
+            yield _sse({"delta": answer})
+        else:
+            # Without web results the answer comes from the RAG prompt alone and is streamed
+            use_hybrid_local = USE_HYBRID
+            citations = _build_citations(rag_results)
+            cache_key = make_answer_key(request.question, rag_results, conversation_context)
+            answer = answer_cache.get(cache_key) if rag_results else None
+            if not rag_results:
+                answer = "Sorry, I couldn't find any information to answer your question. Please try rephrasing or asking something else."
+                yield _sse({"delta": answer})
+            elif answer is not None:
+                yield _sse({"delta": answer})
+            else:
+                try:
+                    system_message, context_message, question_message = await asyncio.to_thread(
+                        build_flexible_prompt_parts, request.question, rag_results
+                    )
+                    messages = [system_message, *conversation_context, context_message, question_message]
+                    parts = []
+                    async for text in _filtered_deltas(stream_answer(messages)):
+                        if not parts:
+                            text = text.lstrip()
+                        if text:
+                            parts.append(text)
+                            yield _sse({"delta": text})
+                    answer = "".join(parts).rstrip()
+                    answer_cache.set(cache_key, answer)
+                    await _store_response(prefix_hash, response_key, query_embedding, answer, citations, use_hybrid_local, rag_results)
+                except Exception as e:
+                    print(f"🔍 DEBUG: Error in RAG streaming: {str(e)}")
+                    answer = f"Sorry, there was an error processing your question: {str(e)}"
+                    citations = []
+                    yield _sse({"delta": answer})
+        
+        turn["answer"], turn["citations"] = answer, citations
+        _finish_turn(conversation_id, answer)
+        turn["completed"] = True
+        yield _sse({
+            "citations": citations,
+            "conversation_id": conversation_id,
+            "vector_db": retriever.name,
+            "hybrid": use_hybrid_local
+        }, event="done")
+    
+    async def events():
+        try:
+            async for frame in answer_events():
+                yield frame
+        finally:
+            # Client disconnected (or the stream failed) before the answer was complete
+            if not turn["completed"]:
+                _abandon_turn(conversation_id, request.question)
+    
+    async def save_turn():
+        # Only finished turns are persisted and prefetched for
+        if not turn["completed"]:
+            return
+        await _save_turn(conversation_id, request.question, turn["answer"], turn["citations"])
+        await _prefetch_next_turn(conversation_id, request.question, query_embedding)
+    
+    return StreamingResponse(events(), media_type="text/event-stream", background=BackgroundTask(save_turn))
+
 @app.get("/status")
 def get_status():
     """Get the status of the vector database."""
     if USE_QDRANT:
         try:
             qdrant_info = get_qdrant_collection_info()
+            quantization = qdrant_info.get("quantization", "none")
             return {
-                "vector_db": "qdrant",
+                # e.g. "qdrant+int8" when search runs on quantized vectors
+                "vector_db": "qdrant" if quantization == "none" else f"qdrant+{quantization}",
+                "quantization": quantization,
                 "status": qdrant_info.get("status", "unknown"),
                 "points_count": qdrant_info.get("points_count", 0),
                 "vector_size": qdrant_info.get("vector_size", 0)
@@ -261,6 +553,12 @@ def get_status():
             "points_count": len(metadata) if metadata is not None else 0
         }
 
+@app.get("/cache/stats")
+def get_cache_stats():
+    """Get answer cache statistics."""
+    return {"answer_cache": answer_cache.stats(), "response_cache": response_cache.stats(),
+            "semantic_cache": semantic_cache.stats()}
+
 @app.post("/add_document")
 def add_document(content: str, source: str = "", section: str = "", filename: str = "", url: str = ""):
     """Add a new document to the vector database."""
@@ -293,10 +591,10 @@ def add_document(content: str, source: str = "", section: str = "", filename: st
         }
 
 @app.post("/conversations/new")
-def create_new_conversation(request: ConversationRequest):
+async def create_new_conversation(request: ConversationRequest):
     """Start a new conversation"""
     try:
-        conversation_id = start_conversation(request.user_id, request.title)
+        conversation_id = await asyncio.to_thread(start_conversation, request.user_id, request.title)
         return {
             "success": True,
             "conversation_id": conversation_id,
@@ -308,18 +606,64 @@ def create_new_conversation(request: ConversationRequest):
             "message": f"Error creating conversation: {str(e)}"
         }
 
+@app.get("/conversations/list")
+def list_all_conversation_ids(limit: int = Query(500, ge=1, le=PAGE_MAX_LIMIT), offset: int = Query(0, ge=0)):
+    """List conversation IDs in the database, most recently updated first (paginated, streamed)"""
+    try:
+        # Count and page from one read transaction, so they agree; the connection goes back
+        # to the pool before streaming starts (a slow or abandoned client can't pin it)
+        with db.connection() as conn:
+            conn.execute("BEGIN")
+            total_conversations = conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+            # Page of conversations joined with their message counts (covered by idx_msg_conv_ts)
+            rows = conn.execute("""
+                SELECT c.conversation_id, c.title, c.created_at, c.last_updated, c.user_id,
+                       COUNT(m.id) as message_count
+                FROM (
+                    SELECT conversation_id, title, created_at, last_updated, user_id
+                    FROM conversations
+                    ORDER BY last_updated DESC
+                    LIMIT ? OFFSET ?
+                ) c
+                LEFT JOIN messages m ON m.conversation_id = c.conversation_id
+                GROUP BY c.conversation_id
+                ORDER BY c.last_updated DESC
+            """, (limit, offset)).fetchall()
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"Error listing conversations: {str(e)}"
+        }
+    
+    def body() -> Iterator[bytes]:
+        yield _json_head({"success": True, "total_conversations": total_conversations,
+                          "limit": limit, "offset": offset}, "conversations")
+        yield from _json_items({
+            "conversation_id": row[0],
+            "title": row[1],
+            "created_at": row[2],
+            "last_updated": row[3],
+            "user_id": row[4],
+            "message_count": row[5]
+        } for row in rows)
+        yield b"]}"
+    
+    return StreamingResponse(body(), media_type="application/json")
+
 @app.get("/conversations/{conversation_id}")
-def get_conversation(conversation_id: str):
+async def get_conversation(conversation_id: str):
     """Get conversation details and history"""
     try:
-        if not conversation_exists(conversation_id):
+        if not await asyncio.to_thread(conversation_exists, conversation_id):
             return {
                 "success": False,
                 "message": "Conversation not found"
             }
         
-        summary = get_conversation_summary(conversation_id)
-        context = get_conversation_context(conversation_id, max_messages=100)
+        summary, context = await asyncio.gather(
+            asyncio.to_thread(get_conversation_summary, conversation_id),
+            asyncio.to_thread(get_conversation_context, conversation_id, max_messages=100)
+        )
         
         return {
             "success": True,
@@ -333,10 +677,10 @@ def get_conversation(conversation_id: str):
         }
 
 @app.get("/conversations")
-def list_conversations(user_id: Optional[str] = None, limit: int = 50):
+async def list_conversations(user_id: Optional[str] = None, limit: int = 50):
     """List conversations"""
     try:
-        conversations = list_user_conversations(user_id, limit)
+        conversations = await asyncio.to_thread(list_user_conversations, user_id, limit)
         return {
             "success": True,
             "conversations": conversations
@@ -348,10 +692,11 @@ def list_conversations(user_id: Optional[str] = None, limit: int = 50):
         }
 
 @app.delete("/conversations/{conversation_id}")
-def delete_conversation_endpoint(conversation_id: str):
+async def delete_conversation_endpoint(conversation_id: str):
     """Delete a conversation"""
     try:
-        success = delete_conversation(conversation_id)
+        success = await asyncio.to_thread(delete_conversation, conversation_id)
+        prompt_managers.forget(conversation_id)
         return {
             "success": success,
             "message": "Conversation deleted" if success else "Conversation not found"
@@ -363,10 +708,10 @@ def delete_conversation_endpoint(conversation_id: str):
         }
 
 @app.put("/conversations/title")
-def update_conversation_title_endpoint(request: UpdateTitleRequest):
+async def update_conversation_title_endpoint(request: UpdateTitleRequest):
     """Update conversation title"""
     try:
-        success = update_conversation_title(request.conversation_id, request.title)
+        success = await asyncio.to_thread(update_conversation_title, request.conversation_id, request.title)
         return {
             "success": success,
             "message": "Title updated" if success else "Conversation not found"
@@ -378,40 +723,29 @@ def update_conversation_title_endpoint(request: UpdateTitleRequest):
         }
 
 @app.get("/conversations/{conversation_id}/database")
-def view_conversation_database(conversation_id: str):
-    """View raw database contents for a specific conversation"""
+def view_conversation_database(conversation_id: str, limit: int = Query(100, ge=1, le=PAGE_MAX_LIMIT),
+                               offset: int = Query(0, ge=0)):
+    """View raw database contents for a specific conversation (messages paginated)"""
     try:
-        from db.database import db
-        import sqlite3
-        
-        # Get conversation info
-        conversation_info = db.get_conversation_info(conversation_id)
-        if not conversation_info:
-            return {
-                "success": False,
-                "message": "Conversation not found"
-            }
-        
-        # Get all messages with full details
-        with sqlite3.connect(db.db_path) as conn:
-            cursor = conn.cursor()
-            
-            # Get conversation details
-            cursor.execute("""
-                SELECT id, conversation_id, created_at, last_updated, title, user_id
-                FROM conversations 
-                WHERE conversation_id = ?
-            """, (conversation_id,))
-            conv_row = cursor.fetchone()
-            
-            # Get all messages
-            cursor.execute("""
-                SELECT id, conversation_id, role, content, metadata, timestamp
-                FROM messages 
+        with db.connection() as conn:
+            conv_row = conn.execute("""
+                SELECT c.id, c.conversation_id, c.created_at, c.last_updated, c.title, c.user_id,
+                       (SELECT COUNT(*) FROM messages m WHERE m.conversation_id = c.conversation_id)
+                FROM conversations c
+                WHERE c.conversation_id = ?
+            """, (conversation_id,)).fetchone()
+            if conv_row is None:
+                return {
+                    "success": False,
+                    "message": "Conversation not found"
+                }
+            rows = conn.execute("""
+                SELECT id, role, content, metadata, timestamp
+                FROM messages
                 WHERE conversation_id = ?
-                ORDER BY timestamp ASC
-            """, (conversation_id,))
-            message_rows = cursor.fetchall()
+                ORDER BY timestamp ASC, id ASC
+                LIMIT ? OFFSET ?
+            """, (conversation_id, limit, offset)).fetchall()
         
         # Format the response
         conversation_data = {
@@ -423,24 +757,22 @@ def view_conversation_database(conversation_id: str):
             "user_id": conv_row[5]
         }
         
-        messages_data = []
-        for row in message_rows:
-            import json
-            metadata = json.loads(row[4]) if row[4] else None
-            messages_data.append({
-                "database_id": row[0],
-                "conversation_id": row[1],
-                "role": row[2],
-                "content": row[3],
-                "metadata": metadata,
-                "timestamp": row[5]
-            })
+        messages_data = [{
+            "database_id": row[0],
+            "conversation_id": conversation_id,
+            "role": row[1],
+            "content": row[2],
+            "metadata": orjson.loads(row[3]) if row[3] else None,
+            "timestamp": row[4]
+        } for row in rows]
         
         return {
             "success": True,
             "conversation": conversation_data,
             "messages": messages_data,
-            "total_messages": len(messages_data)
+            "total_messages": conv_row[6],
+            "limit": limit,
+            "offset": offset
         }
         
     except Exception as e:
@@ -449,106 +781,71 @@ def view_conversation_database(conversation_id: str):
             "message": f"Error viewing database: {str(e)}"
         }
 
-@app.get("/conversations/list")
-def list_all_conversation_ids():
-    """List all conversation IDs in the database"""
-    try:
-        from db.database import db
-        import sqlite3
-        
-        with sqlite3.connect(db.db_path) as conn:
-            cursor = conn.cursor()
-            
-            # Get all conversation IDs with basic info
-            cursor.execute("""
-                SELECT conversation_id, title, created_at, last_updated, user_id,
-                       (SELECT COUNT(*) FROM messages WHERE messages.conversation_id = conversations.conversation_id) as message_count
-                FROM conversations 
-                ORDER BY last_updated DESC
-            """)
-            rows = cursor.fetchall()
-        
-        # Format the response
-        conversations_list = []
-        for row in rows:
-            conversations_list.append({
-                "conversation_id": row[0],
-                "title": row[1],
-                "created_at": row[2],
-                "last_updated": row[3],
-                "user_id": row[4],
-                "message_count": row[5]
-            })
-        
-        return {
-            "success": True,
-            "total_conversations": len(conversations_list),
-            "conversations": conversations_list
-        }
-        
-    except Exception as e:
-        return {
-            "success": False,
-            "message": f"Error listing conversations: {str(e)}"
-        }
+def _json_head(fields: Dict[str, Any], array_name: str) -> bytes:
+    """Opening of a streamed JSON object: the given fields, then an open array."""
+    return orjson.dumps(fields)[:-1] + b',"' + array_name.encode() + b'":['
+
+def _json_items(items: Iterator[Dict[str, Any]]) -> Iterator[bytes]:
+    """Comma-separated JSON array items, encoded one at a time."""
+    separator = b""
+    for item in items:
+        yield separator + orjson.dumps(item)
+        separator = b","
 
 @app.get("/database/all")
-def view_all_database():
-    """View all database contents (for debugging)"""
+def view_all_database(limit: int = Query(500, ge=1, le=PAGE_MAX_LIMIT), offset: int = Query(0, ge=0)):
+    """View database contents page by page (for debugging); limit/offset apply to both lists"""
     try:
-        from db.database import db
-        import sqlite3
-        
-        with sqlite3.connect(db.db_path) as conn:
-            cursor = conn.cursor()
-            
-            # Get all conversations
-            cursor.execute("SELECT * FROM conversations ORDER BY created_at DESC")
-            conversations = cursor.fetchall()
-            
-            # Get all messages
-            cursor.execute("SELECT * FROM messages ORDER BY timestamp ASC")
-            messages = cursor.fetchall()
-        
-        # Format conversations
-        conversations_data = []
-        for row in conversations:
-            conversations_data.append({
-                "database_id": row[0],
-                "conversation_id": row[1],
-                "created_at": row[2],
-                "last_updated": row[3],
-                "title": row[4],
-                "user_id": row[5]
-            })
-        
-        # Format messages
-        messages_data = []
-        for row in messages:
-            import json
-            metadata = json.loads(row[4]) if row[4] else None
-            messages_data.append({
-                "database_id": row[0],
-                "conversation_id": row[1],
-                "role": row[2],
-                "content": row[3][:100] + "..." if len(row[3]) > 100 else row[3],  # Truncate long content
-                "metadata": metadata,
-                "timestamp": row[5]
-            })
-        
-        return {
-            "success": True,
-            "total_conversations": len(conversations_data),
-            "total_messages": len(messages_data),
-            "conversations": conversations_data,
-            "messages": messages_data
-        }
-        
+        # Counts and pages from one read transaction, released before streaming starts
+        with db.connection() as conn:
+            conn.execute("BEGIN")
+            total_conversations, total_messages = conn.execute(
+                "SELECT (SELECT COUNT(*) FROM conversations), (SELECT COUNT(*) FROM messages)"
+            ).fetchone()
+            conversation_rows = conn.execute("""
+                SELECT id, conversation_id, created_at, last_updated, title, user_id
+                FROM conversations
+                ORDER BY created_at DESC
+                LIMIT ? OFFSET ?
+            """, (limit, offset)).fetchall()
+            # Long message content truncated in SQL
+            message_rows = conn.execute("""
+                SELECT id, conversation_id, role,
+                       CASE WHEN length(content) > 100 THEN substr(content, 1, 100) || '...' ELSE content END,
+                       metadata, timestamp
+                FROM messages
+                ORDER BY timestamp ASC, id ASC
+                LIMIT ? OFFSET ?
+            """, (limit, offset)).fetchall()
     except Exception as e:
         return {
             "success": False,
             "message": f"Error viewing database: {str(e)}"
         }
+    
+    def body() -> Iterator[bytes]:
+        yield _json_head({"success": True, "total_conversations": total_conversations,
+                          "total_messages": total_messages, "limit": limit, "offset": offset}, "conversations")
+        yield from _json_items({
+            "database_id": row[0],
+            "conversation_id": row[1],
+            "created_at": row[2],
+            "last_updated": row[3],
+            "title": row[4],
+            "user_id": row[5]
+        } for row in conversation_rows)
+        yield b'],"messages":['
+        yield from _json_items({
+            "database_id": row[0],
+            "conversation_id": row[1],
+            "role": row[2],
+            "content": row[3],
+            "metadata": orjson.loads(row[4]) if row[4] else None,
+            "timestamp": row[5]
+        } for row in message_rows)
+        yield b"]}"
+    
+    return StreamingResponse(body(), media_type="application/json")
 
 # Twitter Bot API Endpoints
 
@@ -0,0 +1,74 @@
+"""
+Micro-batching for blocking per-request work.
+
+Concurrent requests submit single items; a background task gathers whatever
+arrives within a short window (up to a maximum batch size) and runs one
+blocking batch call in a worker thread, then hands each caller its own result.
+Used to turn N concurrent "embed + FAISS search" calls into one embedding
+request and one batched index.search.
+"""
+import asyncio
+import os
+from typing import Any, Callable, List, Optional
+
+BATCH_WINDOW_MS = float(os.getenv("RETRIEVAL_BATCH_WINDOW_MS", "5"))
+BATCH_MAX_SIZE = int(os.getenv("RETRIEVAL_BATCH_SIZE", "32"))
+
+
+class MicroBatcher:
+    """Coalesce concurrent submit() calls into batched calls of a blocking function."""
+
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int = BATCH_MAX_SIZE, max_wait_ms: float = BATCH_WINDOW_MS):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    async def submit(self, item: Any) -> Any:
+        """Queue one item and wait for its result from the next batch."""
+        if self._worker is None or self._worker.done():
+            # Created lazily so the queue and task belong to the running event loop
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            items = [item for item, _ in batch]
+            try:
+                results = await asyncio.to_thread(self.batch_fn, items)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    async def close(self):
+        """Stop the background task (pending callers are cancelled)."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
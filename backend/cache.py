@@ -0,0 +1,224 @@
+"""
+In-process answer caches for the /ask endpoint.
+
+AnswerCache is keyed on the normalized question, the ids of the retrieved chunks
+and a digest of the conversation history, so a hit is only served when the LLM
+would have seen the same prompt inputs. Entries expire after a wall-clock TTL;
+the answer/response caches use the short GROUNDED_ANSWER_TTL because answers
+are generated from live Gemini web-grounded context.
+
+In front of retrieval, /ask checks two response tiers, both scoped to the
+conversation prefix (the history before the question):
+- response_cache: exact (conversation prefix, normalized question) -> response
+- SemanticCache: question embedding -> response; a new question whose cosine
+  similarity to a previously answered one with the same prefix exceeds the
+  threshold reuses that response without an LLM call.
+Cached responses carry the evidence signature of the chunks they were
+generated from; a hit is only served if retrieval for the new question still
+returns the same chunks (so re-indexing never serves stale answers).
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from config import EMBEDDING_MODEL
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "2048"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))  # seconds
+# Generated answers are built from live Gemini web-grounded context (prompt building, judge), so they expire sooner
+GROUNDED_ANSWER_TTL = float(os.getenv("GROUNDED_ANSWER_TTL", "300"))  # seconds
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "10000"))
+# ada-002 packs cosine similarities into a narrow high band (even unrelated questions score ~0.7-0.8 and
+# ones differing in a single entity often score above 0.95), so it needs a stricter cutoff than text-embedding-3-*
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD") or
+                                 (0.985 if EMBEDDING_MODEL == "text-embedding-ada-002" else 0.95))
+# Neighbours checked per lookup, so a near-duplicate from another conversation prefix doesn't hide a match
+SEMANTIC_CACHE_PROBE = int(os.getenv("SEMANTIC_CACHE_PROBE", "8"))
+# Re-run retrieval on a response cache hit and only serve it if the evidence is unchanged
+RESPONSE_CACHE_VERIFY_EVIDENCE = os.getenv("RESPONSE_CACHE_VERIFY_EVIDENCE", "true").lower() == "true"
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase and collapse whitespace so trivial variations share a key."""
+    return " ".join(question.lower().split())
+
+
+def update_context_hash(h, conversation_context: Optional[List[Dict[str, str]]]) -> None:
+    """Feed messages into a running conversation hash (appending messages extends it)."""
+    for message in conversation_context or ():
+        h.update(b"\x1e")
+        h.update(message["role"].encode())
+        h.update(b":")
+        h.update(message["content"].encode())
+
+
+def conversation_prefix_hash(conversation_context: Optional[List[Dict[str, str]]] = None) -> str:
+    """Digest of the conversation history; "" when there is none."""
+    if not conversation_context:
+        return ""
+    h = hashlib.blake2b(digest_size=16)
+    update_context_hash(h, conversation_context)
+    return h.hexdigest()
+
+
+def make_answer_key(question: str, results: List[Dict[str, Any]],
+                    conversation_context: Optional[List[Dict[str, str]]] = None) -> str:
+    """Build the cache key from the question, retrieved chunk ids and history."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(normalize_question(question).encode())
+    h.update(b"|")
+    h.update("|".join(str(r.get("id", r.get("content", ""))) for r in results).encode())
+    update_context_hash(h, conversation_context)
+    return h.hexdigest()
+
+
+def evidence_signature(results: List[Dict[str, Any]]) -> str:
+    """Digest of the ordered retrieved chunks an answer was generated from."""
+    h = hashlib.blake2b(digest_size=16)
+    for r in results:
+        h.update(str(r.get("id", r.get("content", ""))).encode())
+        h.update(b"|")
+    return h.hexdigest()
+
+
+def make_response_key(question: str, prefix_hash: str = "") -> str:
+    """Build the response cache key from the conversation prefix hash and the question."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(prefix_hash.encode())
+    h.update(b"|")
+    h.update(normalize_question(question).encode())
+    return h.hexdigest()
+
+
+class AnswerCache:
+    """Thread-safe LRU cache with a per-entry TTL."""
+
+    def __init__(self, maxsize: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            ts, value = entry
+            if time.monotonic() - ts > self.ttl:
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: str) -> Optional[Any]:
+        """get() that also removes the entry."""
+        value = self.get(key)
+        self.delete(key)
+        return value
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": len(self._data), "maxsize": self.maxsize, "ttl": self.ttl,
+                "hits": self.hits, "misses": self.misses}
+
+
+class SemanticCache:
+    """Nearest-neighbour cache of (question embedding -> value) with FIFO eviction.
+
+    Entries are tagged with a partition (the conversation prefix hash) and only
+    match lookups from the same partition. Embeddings live in a fixed ring
+    buffer, so once the cache is full a new entry overwrites the oldest slot
+    instead of shifting the stored vectors. Lookups are a flat inner-product
+    scan; call both methods off the event loop.
+    """
+
+    def __init__(self, maxsize: int = SEMANTIC_CACHE_SIZE, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 probe: int = SEMANTIC_CACHE_PROBE, ttl: float = ANSWER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.probe = probe
+        self.ttl = ttl
+        self._vectors: Optional[np.ndarray] = None  # (maxsize, d), allocated on first insert once d is known
+        self._values: List[Optional[tuple]] = [None] * max(maxsize, 0)  # slot -> (partition, value, created)
+        self._size = 0
+        self._next_slot = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        vector = np.array(embedding, dtype="float32").ravel()
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def lookup(self, embedding: np.ndarray, partition: str = "") -> Optional[Any]:
+        """Return the cached value of the most similar question in the partition, if similar enough."""
+        query = self._normalize(embedding)
+        with self._lock:
+            if self._size == 0:
+                self.misses += 1
+                return None
+            scores = self._vectors[:self._size] @ query
+            probe = min(self.probe, self._size)
+            top = np.argpartition(-scores, probe - 1)[:probe]
+            # Best first, so stop at the first one under the threshold
+            for slot in top[np.argsort(-scores[top])].tolist():
+                if scores[slot] < self.threshold:
+                    break
+                entry_partition, value, created = self._values[slot]
+                if entry_partition == partition and time.monotonic() - created <= self.ttl:
+                    self.hits += 1
+                    return value
+            self.misses += 1
+            return None
+
+    def add(self, embedding: np.ndarray, value: Any, partition: str = "") -> None:
+        if self.maxsize <= 0:
+            return
+        vector = self._normalize(embedding)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.empty((self.maxsize, vector.shape[0]), dtype="float32")
+            slot = self._next_slot
+            self._vectors[slot] = vector
+            self._values[slot] = (partition, value, time.monotonic())
+            self._next_slot = (slot + 1) % self.maxsize
+            self._size = min(self._size + 1, self.maxsize)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": self._size, "maxsize": self.maxsize, "threshold": self.threshold, "ttl": self.ttl,
+                "hits": self.hits, "misses": self.misses}
+
+
+answer_cache = AnswerCache(ttl=GROUNDED_ANSWER_TTL)
+response_cache = AnswerCache(ttl=GROUNDED_ANSWER_TTL)
+semantic_cache = SemanticCache(ttl=GROUNDED_ANSWER_TTL)
@@ -4,16 +4,20 @@ Script to process and clean generic text files using GPT before embedding.
 This ensures consistent formatting and removes any unnecessary content.
 """
 
+import asyncio
 import os
 import sys
 from pathlib import Path
-from openai import OpenAI
+from openai import AsyncOpenAI
 from config import OPENAI_API_KEY
 
 # Initialize OpenAI client
-client = OpenAI(api_key=OPENAI_API_KEY)
+client = AsyncOpenAI(api_key=OPENAI_API_KEY)
 
-def clean_text_with_gpt(content: str, filename: str) -> str:
+# Files cleaned at once (kept under the OpenAI rate limit)
+CLEAN_CONCURRENCY = int(os.getenv("CLEAN_CONCURRENCY", "10"))
+
+async def clean_text_with_gpt(content: str, filename: str) -> str:
     """Send raw text to GPT for cleaning and formatting."""
     
     system_prompt = """You are a text processing expert. Your task is to clean and format raw text content for a Kaspa cryptocurrency knowledge base.
@@ -47,7 +51,7 @@ RAW CONTENT:
 Please return the cleaned, well-formatted version suitable for a technical knowledge base."""
 
     try:
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -61,8 +65,27 @@ Please return the cleaned, well-formatted version suitable for a technical knowl
         print(f"❌ Error processing {filename}: {e}")
         return content  # Return original if cleaning fails
 
-def process_generic_files():
-    """Process all text files in the generic folder."""
+async def process_generic_file(txt_file: Path, cleaned_dir: Path, semaphore: asyncio.Semaphore):
+    """Clean one text file with GPT and save it to the cleaned directory."""
+    try:
+        # Read original content
+        original_content = await asyncio.to_thread(txt_file.read_text, encoding='utf-8')
+        
+        # Clean with GPT
+        async with semaphore:
+            cleaned_content = await clean_text_with_gpt(original_content, txt_file.name)
+        
+        # Save cleaned version
+        cleaned_file = cleaned_dir / txt_file.name
+        await asyncio.to_thread(cleaned_file.write_text, cleaned_content, encoding='utf-8')
+        
+        print(f"✅ {txt_file.name}: {len(original_content)} -> {len(cleaned_content)} characters, saved to {cleaned_file}")
+        
+    except Exception as e:
+        print(f"❌ Failed to process {txt_file.name}: {e}")
+
+async def process_generic_files():
+    """Process all text files in the generic folder (up to CLEAN_CONCURRENCY at a time)."""
     generic_dir = Path("../data/generic")
     cleaned_dir = Path("../data/generic_cleaned")
     
@@ -73,33 +96,11 @@ def process_generic_files():
     txt_files = [f for f in generic_dir.glob("*.txt") if f.parent.name == "generic"]
     
     print(f"🔍 Found {len(txt_files)} text files to process...")
+    print(f"🤖 Cleaning with GPT ({CLEAN_CONCURRENCY} at a time)...")
     print("=" * 50)
     
-    for txt_file in txt_files:
-        print(f"\n📄 Processing: {txt_file.name}")
-        
-        try:
-            # Read original content
-            with open(txt_file, 'r', encoding='utf-8') as f:
-                original_content = f.read()
-            
-            print(f"📏 Original length: {len(original_content)} characters")
-            
-            # Clean with GPT
-            print("🤖 Cleaning with GPT...")
-            cleaned_content = clean_text_with_gpt(original_content, txt_file.name)
-            
-            print(f"📏 Cleaned length: {len(cleaned_content)} characters")
-            
-            # Save cleaned version
-            cleaned_file = cleaned_dir / txt_file.name
-            with open(cleaned_file, 'w', encoding='utf-8') as f:
-                f.write(cleaned_content)
-            
-            print(f"✅ Saved cleaned version to: {cleaned_file}")
-            
-        except Exception as e:
-            print(f"❌ Failed to process {txt_file.name}: {e}")
+    semaphore = asyncio.Semaphore(CLEAN_CONCURRENCY)
+    await asyncio.gather(*(process_generic_file(f, cleaned_dir, semaphore) for f in txt_files))
     
     print("\n" + "=" * 50)
     print(f"🎉 Processing complete! Cleaned files saved to: {cleaned_dir}")
@@ -122,7 +123,7 @@ def main():
         print("Cancelled.")
         return
     
-    process_generic_files()
+    asyncio.run(process_generic_files())
 
 if __name__ == "__main__":
     main()
@@ -1,8 +1,9 @@
+import asyncio
 from rich.console import Console
-from core import load_flexible_index, retrieve_flexible, build_flexible_prompt
+from core import load_flexible_index, retrieve_flexible, build_flexible_prompt, FAISS_INDEX_PATH
 from llm import generate_answer
 
-INDEX_PATH = "../embeddings/vector_index_flexible.faiss"
+INDEX_PATH = FAISS_INDEX_PATH
 console = Console()
 
 def main():
@@ -10,38 +11,40 @@ def main():
         index, metadata = load_flexible_index(INDEX_PATH)
         console.print("[bold cyan]Kaspa Flexible RAG Chatbot CLI[/bold cyan]")
         console.print(f"📊 Total chunks: {len(metadata)}")
-        console.print(f"📊 Sources: {metadata['source'].value_counts().to_dict()}")
+        console.print(f"📊 Sources: {metadata.source_counts()}")
         console.print()
     except Exception as e:
         console.print(f"[bold red]❌ Error loading flexible index: {e}[/bold red]")
         console.print("Please run: python core.py (to create embeddings)")
         return
     
-    while True:
-        query = console.input("[green]You:[/green] ")
-        if query.lower() in ["exit", "quit"]:
-            break
+    # One event loop for the whole session so the pooled OpenAI connections stay usable
+    with asyncio.Runner() as runner:
+        while True:
+            query = console.input("[green]You:[/green] ")
+            if query.lower() in ["exit", "quit"]:
+                break
         
-        try:
-            results = retrieve_flexible(query, index, metadata, k=5)
-            messages = build_flexible_prompt(query, results)
-            answer = generate_answer(messages)
-            console.print(f"[yellow]Bot:[/yellow] {answer}")
+            try:
+                results = retrieve_flexible(query, index, metadata, k=5)
+                messages = build_flexible_prompt(query, results)
+                answer = runner.run(generate_answer(messages))
+                console.print(f"[yellow]Bot:[/yellow] {answer}")
             
-            # Show sources
-            if results:
-                console.print("\n[dim]Sources:[/dim]")
-                for i, result in enumerate(results[:3], 1):
-                    source_info = f"  {i}. {result['source']}"
-                    if result.get('section'):
-                        source_info += f" ({result['section']})"
-                    if result.get('url'):
-                        source_info += f" - {result['url']}"
-                    console.print(f"[dim]{source_info}[/dim]")
-                console.print()
+                # Show sources
+                if results:
+                    console.print("\n[dim]Sources:[/dim]")
+                    for i, result in enumerate(results[:3], 1):
+                        source_info = f"  {i}. {result['source']}"
+                        if result.get('section'):
+                            source_info += f" ({result['section']})"
+                        if result.get('url'):
+                            source_info += f" - {result['url']}"
+                        console.print(f"[dim]{source_info}[/dim]")
+                    console.print()
                 
-        except Exception as e:
-            console.print(f"[bold red]Error: {e}[/bold red]")
+            except Exception as e:
+                console.print(f"[bold red]Error: {e}[/bold red]")
 
 if __name__ == "__main__":
     main()
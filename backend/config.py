@@ -4,6 +4,15 @@ from dotenv import load_dotenv
 load_dotenv()
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Embedding model shared by index building and query-time retrieval (rebuild the index after changing it)
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+# Optional output size for text-embedding-3-* models (e.g. 256/512): smaller vectors, cheaper search.
+# Left unset for ada-002, which does not accept the parameter.
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "0")) or None
+EMBEDDING_KWARGS = {"dimensions": EMBEDDING_DIMENSIONS} if EMBEDDING_DIMENSIONS else {}
+# Native output size per embedding model; EMBEDDING_SIZE is what every stored vector (FAISS, Qdrant) has
+EMBEDDING_MODEL_SIZES = {"text-embedding-ada-002": 1536, "text-embedding-3-small": 1536, "text-embedding-3-large": 3072}
+EMBEDDING_SIZE = EMBEDDING_DIMENSIONS or EMBEDDING_MODEL_SIZES.get(EMBEDDING_MODEL, 1536)
 
 print(f"🔍 DEBUG: OPENAI_API_KEY loaded: {'YES' if OPENAI_API_KEY else 'NO'}")
 if OPENAI_API_KEY:
@@ -3,49 +3,290 @@ Core functionality for Kaspa RAG system.
 Consolidates embedding creation, retrieval, and data processing.
 """
 
-import json
+import hashlib
+import os
 import re
+import sqlite3
+import threading
 import faiss
 import numpy as np
+import orjson
 import pandas as pd
+import pyarrow.parquet as pq
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import cached_property, lru_cache, partial
 from pathlib import Path
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Optional, Iterable
 from tqdm import tqdm
 from openai import OpenAI
 
-from config import OPENAI_API_KEY
-from pdf_processor import process_whitepaper_pdf
+from config import OPENAI_API_KEY, EMBEDDING_MODEL, EMBEDDING_KWARGS
+from cache import AnswerCache
+from pdf_processor import process_whitepaper_pdf, PDF_WORKERS
 from gemini_search import enhanced_web_search
 # Initialize OpenAI client
 client = OpenAI(api_key=OPENAI_API_KEY)
 
+# Where the FAISS index (and its .meta.parquet sidecar) is written and loaded from
+FAISS_INDEX_PATH = os.getenv("FAISS_INDEX_PATH", "../embeddings/vector_index_flexible.faiss")
+# FAISS index layout used when (re)building embeddings: flat | fp16 | sq8 | sq8-refine | binary | hnsw | ivfpq | ivfpq-fs
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat").lower()
+# Oversampling for quantized indexes with float32 rerank: search k * factor codes, rerank exactly
+FAISS_REFINE_K_FACTOR = float(os.getenv("FAISS_REFINE_K_FACTOR", "4"))
+# HNSW candidate list size at query time (raised to search_k if smaller)
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+# IVF lists probed per query (higher = better recall, slower)
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+# Product-quantizer sub-vectors for ivfpq (must divide the embedding dimension)
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "8"))
+# Texts per embeddings API call when building the index (the API accepts up to 2048 inputs)
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+# Embedding batches requested concurrently
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "4"))
+# Retries per index-build batch; concurrent batches hit rate limits (429s back off exponentially, honouring Retry-After)
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "6"))
+# Source text files read concurrently when building the index
+FILE_READ_WORKERS = int(os.getenv("FILE_READ_WORKERS", "8"))
+# In-process cache of query embeddings, so repeated questions skip the embeddings API call
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+# Optional SQLite file backing the query-embedding cache, so it survives restarts ("" disables)
+EMBEDDING_CACHE_DB = os.getenv("EMBEDDING_CACHE_DB", "")
+# Upper bound on retrieved text put into the prompt context (~4 characters per token)
+PROMPT_CONTEXT_CHAR_BUDGET = int(os.getenv("PROMPT_CONTEXT_CHAR_BUDGET", "24000"))
+# Move the loaded index to GPU when faiss-gpu and a CUDA device are available
+FAISS_USE_GPU = os.getenv("FAISS_USE_GPU", "true").lower() == "true"
+# Memory-map the index read-only instead of copying it into each process; Uvicorn workers then
+# share one copy through the page cache (put FAISS_INDEX_PATH on tmpfs, e.g. /dev/shm, to keep it in RAM)
+FAISS_MMAP = os.getenv("FAISS_MMAP", "false").lower() in ("1", "true")
+# IO_FLAG_MMAP covers IVF inverted lists, IO_FLAG_MMAP_IFC flat codes (newer FAISS builds only)
+FAISS_MMAP_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+# OpenMP threads per process for (batched) FAISS searches; 0 keeps FAISS's default of one per core.
+# With several Uvicorn workers, set about cores / workers so processes don't oversubscribe the CPU.
+FAISS_OMP_THREADS = int(os.getenv("FAISS_OMP_THREADS", "0"))
+if FAISS_OMP_THREADS > 0:
+    faiss.omp_set_num_threads(FAISS_OMP_THREADS)
+
+
+# =============================================================================
+# FAISS INDEX TYPES
+# =============================================================================
+
+def _build_flat_index(vectors: np.ndarray) -> faiss.Index:
+    """Exact float32 L2 search."""
+    return faiss.IndexFlatL2(vectors.shape[1])
+
+
+def _build_fp16_index(vectors: np.ndarray) -> faiss.Index:
+    """Half-precision vectors: 2x smaller than flat with practically identical ranking."""
+    index = faiss.IndexScalarQuantizer(vectors.shape[1], faiss.ScalarQuantizer.QT_fp16)
+    index.train(vectors)  # no-op for fp16, kept for a uniform build path
+    return index
+
+
+def _build_sq8_index(vectors: np.ndarray) -> faiss.Index:
+    """8-bit scalar quantization: 4x smaller codes, near-exact L2 ranking."""
+    index = faiss.IndexScalarQuantizer(vectors.shape[1], faiss.ScalarQuantizer.QT_8bit)
+    index.train(vectors)
+    return index
+
+
+def _build_sq8_refine_index(vectors: np.ndarray) -> faiss.Index:
+    """8-bit scalar quantized search, oversampled and reranked with exact float32 L2."""
+    index = faiss.IndexRefineFlat(_build_sq8_index(vectors))
+    index.k_factor = FAISS_REFINE_K_FACTOR
+    return index
+
+
+def _build_binary_index(vectors: np.ndarray) -> faiss.Index:
+    """Sign-bit (1 bit per dimension) Hamming search, oversampled and reranked with exact L2."""
+    dim = vectors.shape[1]
+    index = faiss.IndexRefineFlat(faiss.IndexLSH(dim, dim, False, False))
+    index.k_factor = FAISS_REFINE_K_FACTOR
+    return index
+
+
+def _build_hnsw_index(vectors: np.ndarray) -> faiss.Index:
+    """HNSW graph over float32 vectors: ~logarithmic query cost instead of a full scan."""
+    index = faiss.IndexHNSWFlat(vectors.shape[1], 32)
+    index.hnsw.efConstruction = 200
+    return index
+
+
+def _build_ivfpq_index(vectors: np.ndarray) -> faiss.Index:
+    """IVF-PQ (sqrt(N) lists, 8-bit PQ codes): scans only nprobe lists, reranked with exact L2."""
+    n, dim = vectors.shape
+    if n < 2:  # PQ codes need at least 1 bit, i.e. 2 training vectors
+        print(f"⚠️ {n} vectors are too few to train PQ, building a flat index instead")
+        return _build_flat_index(vectors)
+    nlist = max(1, int(np.sqrt(n)))
+    nbits = min(8, int(np.log2(n)))  # PQ training needs at least 2**nbits vectors
+    ivfpq = faiss.IndexIVFPQ(faiss.IndexFlatL2(dim), dim, nlist, FAISS_PQ_M, nbits)
+    index = faiss.IndexRefineFlat(ivfpq)
+    index.k_factor = FAISS_REFINE_K_FACTOR
+    index.train(vectors)
+    return index
+
+
+def _build_ivfpq_fastscan_index(vectors: np.ndarray) -> faiss.Index:
+    """IVF-PQ with 4-bit fast-scan codes (SIMD lookup tables, in-register), reranked with exact L2."""
+    n, dim = vectors.shape
+    if n < 16:  # fast-scan codes are always 4-bit; PQ training needs at least 2**4 vectors
+        print(f"⚠️ {n} vectors are too few to train 4-bit fast-scan PQ, building a flat index instead")
+        return _build_flat_index(vectors)
+    nlist = max(1, int(np.sqrt(n)))
+    ivfpq = faiss.IndexIVFPQFastScan(faiss.IndexFlatL2(dim), dim, nlist, FAISS_PQ_M, 4)
+    index = faiss.IndexRefineFlat(ivfpq)
+    index.k_factor = FAISS_REFINE_K_FACTOR
+    index.train(vectors)
+    return index
+
+
+INDEX_BUILDERS = {
+    "flat": _build_flat_index,
+    "fp16": _build_fp16_index,
+    "sq8": _build_sq8_index,
+    "sq8-refine": _build_sq8_refine_index,
+    "binary": _build_binary_index,
+    "hnsw": _build_hnsw_index,
+    "ivfpq": _build_ivfpq_index,
+    "ivfpq-fs": _build_ivfpq_fastscan_index,
+}
+
+
+def normalize_vectors(vectors: np.ndarray, copy: bool = True) -> np.ndarray:
+    """Unit-length float32 copy of the vectors (normalized in place with copy=False when already float32).
+
+    On unit vectors L2 distance is monotonic in cosine similarity (d^2 = 2 - 2cos),
+    so the L2 indexes rank by cosine without switching metric.
+    """
+    if copy:
+        vectors = np.array(vectors, dtype="float32", ndmin=2)
+    else:
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def build_index(vectors: np.ndarray, index_type: str = FAISS_INDEX_TYPE, copy: bool = True) -> faiss.Index:
+    """Build and populate a FAISS index of the given type from float32 vectors.
+
+    With copy=False the caller's (N, d) float32 array is normalized in place instead of copied.
+    """
+    if index_type not in INDEX_BUILDERS:
+        raise ValueError(f"Unknown FAISS index type '{index_type}'. Choose from: {', '.join(INDEX_BUILDERS)}")
+    vectors = normalize_vectors(vectors, copy=copy)
+    index = INDEX_BUILDERS[index_type](vectors)
+    index.add(vectors)
+    return index
+
+
+def rebuild_index(index_type: str = FAISS_INDEX_TYPE, source_path: str = FAISS_INDEX_PATH,
+                  output_path: Optional[str] = None):
+    """Rebuild an existing index as another type from its stored vectors (no re-embedding)."""
+    output_path = output_path or source_path
+    index, metadata = load_index(source_path)
+    vectors = _exact_vectors(index)
+    if vectors is None:
+        print("⚠️ Source index stores quantized vectors only; rebuilding from lossy reconstructions")
+        vectors = index.reconstruct_n(0, index.ntotal)
+    
+    new_index = build_index(vectors, index_type, copy=False)
+    faiss.write_index(new_index, output_path)
+    metadata.to_frame().to_parquet(output_path + ".meta.parquet", compression="zstd", index=False)
+    load_index.cache_clear()
+    print(f"📐 Rebuilt {index.ntotal} vectors as '{index_type}' index at {output_path}")
+
 
 # =============================================================================
 # EMBEDDING CREATION
 # =============================================================================
 
+def embed_texts(texts: List[str], batch_size: int = EMBEDDING_BATCH_SIZE,
+                workers: int = EMBEDDING_WORKERS) -> np.ndarray:
+    """Embed many texts: one API call per batch, several batches in flight at once."""
+    batches = [texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+    vectors = None
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # map() yields batches in order, so each fills its own slice of the preallocated array
+        embed = partial(_embed_batch, max_retries=EMBEDDING_MAX_RETRIES)
+        results = tqdm(pool.map(embed, batches), total=len(batches), unit="batch")
+        for batch_number, batch_vectors in enumerate(results):
+            if vectors is None:
+                vectors = np.empty((len(texts), batch_vectors.shape[1]), dtype="float32")
+            start = batch_number * batch_size
+            vectors[start:start + len(batch_vectors)] = batch_vectors
+    return vectors
+
+
+def _exact_vectors(index: faiss.Index) -> Optional[np.ndarray]:
+    """The index's stored float32 vectors, or None if it only keeps lossy (quantized) codes."""
+    index = faiss.downcast_index(index)
+    # Refine layouts keep the originals next to the codes; HNSW-flat keeps them as graph storage
+    if isinstance(index, faiss.IndexRefine):
+        index = faiss.downcast_index(index.refine_index)
+    elif isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    if not isinstance(index, faiss.IndexFlat):
+        return None
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def _existing_vectors(index_path: str) -> Dict[str, np.ndarray]:
+    """Vectors of a previously built index by embedding key, for reuse when re-indexing."""
+    if not Path(index_path).exists():
+        return {}
+    try:
+        index, metadata = load_index(index_path)
+    except Exception as e:
+        print(f"⚠️ Could not read existing index for reuse: {e}")
+        return {}
+    keys = metadata.columns.get("embedding_key")
+    if keys is None:
+        return {}  # built before embedding keys were stored
+    # Reconstructions from quantized layouts are lossy; reusing them would compound the error every rebuild
+    vectors = _exact_vectors(index)
+    if vectors is None:
+        print("⚠️ Existing index stores quantized vectors only, re-embedding all chunks")
+        return {}
+    return {key: vectors[i] for i, key in enumerate(keys) if key}
+
+
 def create_embeddings(df: pd.DataFrame, index_path: str):
-    """Create and save FAISS embeddings from DataFrame."""
-    vectors = []
-    metadata = []
-
-    for _, row in tqdm(df.iterrows(), total=len(df)):
-        emb = client.embeddings.create(
-            model="text-embedding-ada-002",
-            input=row["content"]
-        ).data[0].embedding
-        vectors.append(emb)
-        metadata.append(row.to_dict())
-
-    # Save FAISS index
-    dim = len(vectors[0])
-    index = faiss.IndexFlatL2(dim)
-    index.add(np.array(vectors).astype("float32"))
+    """Create and save FAISS embeddings from DataFrame.
+
+    Chunks whose text (and embedding model) is unchanged since the last build
+    reuse their stored vectors; only new or edited chunks are embedded.
+    """
+    df = df.reset_index(drop=True)
+    df["embedding_key"] = [embedding_key(content) for content in df["content"]]
+    existing = _existing_vectors(index_path)
+    missing = [i for i, key in enumerate(df["embedding_key"]) if key not in existing]
+    print(f"♻️ Reusing {len(df) - len(missing)} stored embeddings, embedding {len(missing)} chunks")
+
+    new_vectors = embed_texts(df["content"].iloc[missing].tolist()) if missing else None
+    if len(missing) == len(df):
+        # Fresh build: embed_texts already filled one preallocated (N, d) array in row order
+        vectors = new_vectors
+    else:
+        dim = new_vectors.shape[1] if new_vectors is not None else len(next(iter(existing.values())))
+        vectors = np.empty((len(df), dim), dtype="float32")
+        for i, key in enumerate(df["embedding_key"]):
+            if key in existing:
+                vectors[i] = existing[key]
+        if missing:
+            vectors[missing] = new_vectors
+
+    # Save FAISS index (vectors are normalized in place; nothing else uses them)
+    index = build_index(vectors, copy=False)
     faiss.write_index(index, index_path)
+    print(f"📐 Built '{FAISS_INDEX_TYPE}' FAISS index with {index.ntotal} vectors")
 
-    # Save metadata
-    pd.DataFrame(metadata).to_json(index_path + ".meta.json", orient="records", indent=2)
-    print(f"✅ Saved index to {index_path} and metadata to {index_path}.meta.json")
+    # Save metadata as Parquet: columnar and compressed, loads without per-row JSON parsing
+    df.to_parquet(index_path + ".meta.parquet", compression="zstd", index=False)
+    load_index.cache_clear()
+    print(f"✅ Saved index to {index_path} and metadata to {index_path}.meta.parquet")
 
 
 # =============================================================================
@@ -57,8 +298,8 @@ def load_and_chunk_kasparchive(json_path: str) -> List[Dict[str, Any]]:
     if not Path(json_path).exists():
         return []
     
-    with open(json_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    # orjson parses straight from bytes, skipping the text decode and stdlib parser
+    data = orjson.loads(Path(json_path).read_bytes())
     
     chunks = []
     for section in data.get("sections", []):
@@ -82,6 +323,11 @@ def load_and_chunk_kasparchive(json_path: str) -> List[Dict[str, Any]]:
     return chunks
 
 
+# Numbered FUD points "1)" .. "10)" and the quoted claim (first to last quote) on that line
+_POINT_RE = re.compile(r'^(10|[1-9])\)(.*)$')
+_QUOTED_RE = re.compile(r'"(.*)"')
+
+
 def parse_kaspa_x_content(content: str) -> List[Dict[str, Any]]:
     """Parse Kaspa X/Twitter content into chunks."""
     lines = content.strip().split('\n')
@@ -95,7 +341,8 @@ def parse_kaspa_x_content(content: str) -> List[Dict[str, Any]]:
             continue
             
         # Check for numbered points
-        if any(line.startswith(f'{i})') for i in range(1, 11)):
+        match = _POINT_RE.match(line)
+        if match:
             # Save previous section
             if current_section and current_content:
                 chunks.append({
@@ -107,13 +354,12 @@ def parse_kaspa_x_content(content: str) -> List[Dict[str, Any]]:
                 })
             
             # Start new section
-            point_num = line.split(')')[0]
-            start_quote = line.find('"')
-            end_quote = line.rfind('"')
-            if start_quote != -1 and end_quote != -1 and end_quote > start_quote:
-                claim = line[start_quote+1:end_quote]
+            point_num, rest = match.group(1), match.group(2)
+            quoted = _QUOTED_RE.search(line)
+            if quoted:
+                claim = quoted.group(1)
             else:
-                claim = line.split(')')[1].strip()
+                claim = rest.split(')', 1)[0].strip()
             
             current_section = point_num
             current_content = [f"FUD {point_num}: {claim}"]
@@ -133,6 +379,10 @@ def parse_kaspa_x_content(content: str) -> List[Dict[str, Any]]:
     return chunks
 
 
+# Line prefixes that open a new discussion in the X/Twitter dump
+_TWITTER_TOPIC_PREFIXES = ('⚡️', '🧠', '⚙️', 'A common FUD', '@')
+
+
 def parse_twitter_content(content: str, filename: str) -> List[Dict[str, Any]]:
     """Parse Twitter/X content into meaningful chunks."""
     # Split content by major topics or discussion threads
@@ -149,8 +399,7 @@ def parse_twitter_content(content: str, filename: str) -> List[Dict[str, Any]]:
             continue
         
         # Check if this starts a new major topic/discussion
-        if (line.startswith('⚡️') or line.startswith('🧠') or line.startswith('⚙️') or 
-            line.startswith('A common FUD') or line.startswith('@') or
+        if (line.startswith(_TWITTER_TOPIC_PREFIXES) or
             'Question about' in line or 'Playing Devils Advocate' in line):
             # Save previous section
             if current_section:
@@ -200,14 +449,15 @@ def parse_twitter_content(content: str, filename: str) -> List[Dict[str, Any]]:
 
 def parse_generic_text(content: str, filename: str, source_type: str = "generic") -> List[Dict[str, Any]]:
     """Parse generic text content into chunks."""
-    paragraphs = content.strip().split('\n\n')
+    # Strip each paragraph once; empty ones still count towards the numbering
+    paragraphs = map(str.strip, content.strip().split('\n\n'))
     chunks = []
     
     for i, paragraph in enumerate(paragraphs):
-        if paragraph.strip():
+        if paragraph:
             chunks.append({
                 "id": f"{source_type}_{filename}_{i}",
-                "content": paragraph.strip(),
+                "content": paragraph,
                 "source": source_type,
                 "section": f"Section {i+1}",
                 "filename": filename
@@ -216,6 +466,62 @@ def parse_generic_text(content: str, filename: str, source_type: str = "generic"
     return chunks
 
 
+def _scan_by_extension(directory: Path, extensions: Tuple[str, ...]) -> Dict[str, List[Path]]:
+    """List files in a directory grouped by extension, using a single scandir pass."""
+    files = {ext: [] for ext in extensions}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            # Same matches as Path.glob("*.ext"): case-sensitive extension, regular files only
+            if '.' not in entry.name:
+                continue
+            ext = entry.name.rsplit('.', 1)[1]
+            if ext in files and entry.is_file():
+                files[ext].append(Path(entry.path))
+    return files
+
+
+def _read_texts(paths: List[Path]) -> List[str]:
+    """Read UTF-8 text files concurrently (in order); the reads are I/O-bound, so threads suffice."""
+    if len(paths) < 2:
+        return [path.read_text(encoding='utf-8') for path in paths]
+    with ThreadPoolExecutor(max_workers=min(FILE_READ_WORKERS, len(paths))) as pool:
+        return list(pool.map(lambda path: path.read_text(encoding='utf-8'), paths))
+
+
+def _process_pdfs(pdf_files: List[Path]) -> List[Dict[str, Any]]:
+    """
+    Process whitepaper PDFs, one worker process per file when there are several.
+    A single PDF keeps page-level parallelism instead; nested pools are avoided by
+    running each file single-process inside the outer pool.
+    """
+    chunks = []
+    workers = min(PDF_WORKERS, len(pdf_files))
+    
+    if workers <= 1:
+        for pdf_file in pdf_files:
+            try:
+                print(f"📄 Processing PDF: {pdf_file.name}")
+                pdf_chunks = process_whitepaper_pdf(str(pdf_file))
+                chunks.extend(pdf_chunks)
+                print(f"✅ Loaded {len(pdf_chunks)} intelligent chunks from {pdf_file.name}")
+            except Exception as e:
+                print(f"❌ Failed to process {pdf_file.name}: {e}")
+        return chunks
+    
+    print(f"📄 Processing {len(pdf_files)} PDFs with {workers} workers...")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [(pdf_file, executor.submit(process_whitepaper_pdf, str(pdf_file), 1)) for pdf_file in pdf_files]
+        # Collect in submission order so chunk order matches the sequential path
+        for pdf_file, future in futures:
+            try:
+                pdf_chunks = future.result()
+                chunks.extend(pdf_chunks)
+                print(f"✅ Loaded {len(pdf_chunks)} intelligent chunks from {pdf_file.name}")
+            except Exception as e:
+                print(f"❌ Failed to process {pdf_file.name}: {e}")
+    return chunks
+
+
 def create_comprehensive_embeddings():
     """Create embeddings from all available content sources."""
     all_chunks = []
@@ -241,25 +547,16 @@ def create_comprehensive_embeddings():
     whitepaper_dir = Path("../data/whitepapers")
     if whitepaper_dir.exists():
         print("📖 Loading whitepapers...")
+        whitepaper_files = _scan_by_extension(whitepaper_dir, ("txt", "pdf"))
         
         # Process text files
-        for whitepaper_file in whitepaper_dir.glob("*.txt"):
-            with open(whitepaper_file, 'r', encoding='utf-8') as f:
-                content = f.read()
+        for whitepaper_file, content in zip(whitepaper_files["txt"], _read_texts(whitepaper_files["txt"])):
             chunks = parse_generic_text(content, whitepaper_file.stem, "whitepaper")
             all_chunks.extend(chunks)
             print(f"✅ Loaded {len(chunks)} chunks from {whitepaper_file.name}")
         
         # Process PDF files
-        for pdf_file in whitepaper_dir.glob("*.pdf"):
-            try:
-                print(f"📄 Processing PDF: {pdf_file.name}")
-                pdf_chunks = process_whitepaper_pdf(str(pdf_file))
-                all_chunks.extend(pdf_chunks)
-                print(f"✅ Loaded {len(pdf_chunks)} intelligent chunks from {pdf_file.name}")
-            except Exception as e:
-                print(f"❌ Failed to process {pdf_file.name}: {e}")
-                continue
+        all_chunks.extend(_process_pdfs(whitepaper_files["pdf"]))
     
     # 4. Load generic content (prioritize cleaned versions)
     generic_dir = Path("../data/generic")
@@ -271,40 +568,30 @@ def create_comprehensive_embeddings():
         # Check for cleaned versions first
         if generic_cleaned_dir.exists():
             print("🧹 Using cleaned versions from generic_cleaned/")
-            for text_file in generic_cleaned_dir.glob("*.txt"):
-                with open(text_file, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                # Special handling for Twitter content
-                if text_file.name == "x.txt":
-                    print("🐦 Processing Twitter/X content with special parser...")
-                    chunks = parse_twitter_content(content, text_file.stem)
-                    all_chunks.extend(chunks)
-                    print(f"✅ Loaded {len(chunks)} Twitter discussion chunks from {text_file.name}")
-                else:
-                    chunks = parse_generic_text(content, text_file.stem, "generic")
-                    all_chunks.extend(chunks)
-                    print(f"✅ Loaded {len(chunks)} chunks from cleaned {text_file.name}")
+            text_files = _scan_by_extension(generic_cleaned_dir, ("txt",))["txt"]
+            label = "cleaned "
         else:
             print("📄 Using original versions from generic/ (run clean_generic_texts.py for better results)")
             # Only load .txt files directly in generic folder, exclude subdirectories
-            for text_file in generic_dir.glob("*.txt"):
+            text_files = []
+            for text_file in _scan_by_extension(generic_dir, ("txt",))["txt"]:
                 if text_file.parent.name == "generic":  # Exclude files in subdirectories like kips/
-                    with open(text_file, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                    
-                    # Special handling for Twitter content
-                    if text_file.name == "x.txt":
-                        print("🐦 Processing Twitter/X content with special parser...")
-                        chunks = parse_twitter_content(content, text_file.stem)
-                        all_chunks.extend(chunks)
-                        print(f"✅ Loaded {len(chunks)} Twitter discussion chunks from {text_file.name}")
-                    else:
-                        chunks = parse_generic_text(content, text_file.stem, "generic")
-                        all_chunks.extend(chunks)
-                        print(f"✅ Loaded {len(chunks)} chunks from {text_file.name}")
+                    text_files.append(text_file)
                 else:
                     print(f"⏭️  Skipping {text_file.name} (in subfolder - run clean_generic_texts.py to include)")
+            label = ""
+        
+        for text_file, content in zip(text_files, _read_texts(text_files)):
+            # Special handling for Twitter content
+            if text_file.name == "x.txt":
+                print("🐦 Processing Twitter/X content with special parser...")
+                chunks = parse_twitter_content(content, text_file.stem)
+                all_chunks.extend(chunks)
+                print(f"✅ Loaded {len(chunks)} Twitter discussion chunks from {text_file.name}")
+            else:
+                chunks = parse_generic_text(content, text_file.stem, "generic")
+                all_chunks.extend(chunks)
+                print(f"✅ Loaded {len(chunks)} chunks from {label}{text_file.name}")
     
     if not all_chunks:
         print("❌ No content found to embed!")
@@ -314,12 +601,12 @@ def create_comprehensive_embeddings():
     df = pd.DataFrame(all_chunks)
     print(f"🔍 Creating embeddings for {len(df)} chunks...")
     
-    index_path = "../embeddings/vector_index_flexible.faiss"
+    index_path = FAISS_INDEX_PATH
     create_embeddings(df, index_path)
     
     print(f"✅ Embeddings created successfully!")
     print(f"📁 Index saved to: {index_path}")
-    print(f"📁 Metadata saved to: {index_path}.meta.json")
+    print(f"📁 Metadata saved to: {index_path}.meta.parquet")
     print(f"📊 Total chunks: {len(df)}")
     print(f"📊 Sources: {df['source'].value_counts().to_dict()}")
 
@@ -328,95 +615,388 @@ def create_comprehensive_embeddings():
 # RETRIEVAL
 # =============================================================================
 
-def load_index(index_path: str) -> Tuple[faiss.Index, pd.DataFrame]:
-    """Load FAISS index and metadata."""
-    index = faiss.read_index(index_path)
-    metadata = pd.read_json(index_path + ".meta.json")
+def index_to_gpu(index: faiss.Index) -> faiss.Index:
+    """
+    Copy an index to the GPU(s) if possible, otherwise return it unchanged.
+    With several GPUs the index is replicated on each and batched searches are
+    split across them. Flat/IVF/SQ indexes are supported on GPU; HNSW and the
+    binary (LSH + refine) layout are not and stay on CPU.
+    """
+    if not FAISS_USE_GPU or not hasattr(faiss, "StandardGpuResources") or faiss.get_num_gpus() == 0:
+        return index
+    try:
+        num_gpus = faiss.get_num_gpus()
+        if num_gpus > 1:
+            gpu_index = faiss.index_cpu_to_all_gpus(index)  # holds its own GPU resources
+        else:
+            res = faiss.StandardGpuResources()
+            gpu_index = faiss.index_cpu_to_gpu(res, 0, index)
+            gpu_index.gpu_resources = res  # keep resources alive as long as the index
+        print(f"🚀 Moved FAISS index to {num_gpus} GPU(s)")
+        return gpu_index
+    except Exception as e:
+        print(f"⚠️ Could not move FAISS index to GPU, staying on CPU: {e}")
+        return index
+
+
+class ChunkMetadata:
+    """Chunk metadata stored column-wise (one NumPy array per field), indexed by FAISS row id."""
+    
+    # Fields copied into retrieval results; missing values become "" so results stay JSON-safe
+    TEXT_COLUMNS = ("id", "content", "source", "section", "url", "filename")
+    
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        n = len(next(iter(columns.values()))) if columns else 0
+        for name in self.TEXT_COLUMNS:
+            values = columns.get(name)
+            if values is None:
+                columns[name] = np.full(n, "", dtype=object)
+            else:
+                columns[name] = np.array(["" if v is None or v != v else v for v in values], dtype=object)
+        self.columns = columns
+        self.id = columns["id"]
+        self.content = columns["content"]
+        self.source = columns["source"]
+        self.section = columns["section"]
+        self.url = columns["url"]
+        self.filename = columns["filename"]
+    
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "ChunkMetadata":
+        return cls({name: df[name].to_numpy(dtype=object) for name in df.columns})
+    
+    @classmethod
+    def read_parquet(cls, path: str, memory_map: bool = False) -> "ChunkMetadata":
+        table = pq.read_table(path, memory_map=memory_map)
+        return cls({name: table.column(name).to_numpy(zero_copy_only=False) for name in table.column_names})
+    
+    def __len__(self) -> int:
+        return len(self.content)
+    
+    @cached_property
+    def boosts(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Per-chunk arrays of _chunk_boost: (boost, mentions KNIGHT, mentions safety/liveness)."""
+        scored = [_chunk_boost(content, source) for content, source in zip(self.content, self.source)]
+        boosts, knight, safety = zip(*scored) if scored else ((), (), ())
+        return np.array(boosts, dtype="float64"), np.array(knight, dtype=bool), np.array(safety, dtype=bool)
+    
+    def source_counts(self) -> Dict[str, int]:
+        """Chunks per source, most common first."""
+        return dict(Counter(self.source).most_common())
+    
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.columns)
+
+
+@lru_cache(maxsize=4)
+def load_index(index_path: str) -> Tuple[faiss.Index, ChunkMetadata]:
+    """Load FAISS index and metadata (cached per path, so repeated imports share one copy)."""
+    if FAISS_MMAP:
+        index = faiss.read_index(index_path, FAISS_MMAP_FLAGS)
+    else:
+        index = faiss.read_index(index_path)
+    parquet_path = index_path + ".meta.parquet"
+    if Path(parquet_path).exists():
+        metadata = ChunkMetadata.read_parquet(parquet_path, memory_map=FAISS_MMAP)
+    else:
+        # Indexes built before the Parquet switch only have JSON metadata (a records array; orjson parses it)
+        records = orjson.loads(Path(index_path + ".meta.json").read_bytes())
+        metadata = ChunkMetadata.from_frame(pd.DataFrame(records))
+    metadata.boosts  # score every chunk's content once here, not on the query path
     return index, metadata
 
 
-def retrieve(query: str, index: faiss.Index, metadata: pd.DataFrame, k: int = 8) -> List[Dict[str, Any]]:
-    """Retrieve relevant chunks using semantic search with technical prioritization."""
-    # Create query embedding
-    query_embedding = client.embeddings.create(
-        model="text-embedding-ada-002",
-        input=query
+def load_exact_vectors(index_path: str = FAISS_INDEX_PATH) -> Tuple[np.ndarray, ChunkMetadata]:
+    """An index's float32 vectors and their metadata, for exporting them (e.g. to Qdrant)."""
+    index, metadata = load_index(index_path)
+    vectors = _exact_vectors(index)
+    if vectors is None:
+        raise ValueError(
+            f"{index_path} stores quantized vectors only ({type(faiss.downcast_index(index)).__name__}); "
+            "rebuild the embeddings with FAISS_INDEX_TYPE=flat, hnsw or sq8-refine to export exact vectors"
+        )
+    return vectors, metadata
+
+
+def embedding_key(text: str) -> str:
+    """Cache key for the embedding of a text under the configured model and dimensions."""
+    h = hashlib.sha256(f"{EMBEDDING_MODEL}:{EMBEDDING_KWARGS.get('dimensions', '')}".encode())
+    h.update(b"\0")
+    h.update(text.encode())
+    return h.hexdigest()
+
+
+class EmbeddingStore:
+    """Query embeddings by embedding_key in a SQLite file (the on-disk tier behind embedding_cache)."""
+    
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")  # several API workers can share the file
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[np.ndarray]:
+        try:
+            with self._lock:
+                row = self._conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"⚠️ Embedding store read failed: {e}")
+            return None
+        # frombuffer over bytes is read-only, like the in-memory entries
+        return np.frombuffer(row[0], dtype="float32") if row else None
+    
+    def set(self, key: str, vector: np.ndarray):
+        try:
+            with self._lock:
+                self._conn.execute("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                                   (key, vector.astype("float32").tobytes()))
+        except sqlite3.Error as e:
+            print(f"⚠️ Embedding store write failed: {e}")
+
+
+embedding_cache = AnswerCache(EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_TTL)
+embedding_store = EmbeddingStore(EMBEDDING_CACHE_DB) if EMBEDDING_CACHE_DB else None
+
+
+def _cached_embedding(text: str) -> Optional[np.ndarray]:
+    """Embedding of a text from memory, then from the on-disk store (None if neither has it)."""
+    key = embedding_key(text)
+    vector = embedding_cache.get(key)
+    if vector is None and embedding_store is not None:
+        vector = embedding_store.get(key)
+        if vector is not None:
+            embedding_cache.set(key, vector)
+    return vector
+
+
+def _remember_embedding(text: str, vector: np.ndarray) -> np.ndarray:
+    vector.setflags(write=False)  # shared by every request that asks the same question
+    key = embedding_key(text)
+    embedding_cache.set(key, vector)
+    if embedding_store is not None:
+        embedding_store.set(key, vector)
+    return vector
+
+
+def embed_query(query: str) -> np.ndarray:
+    """Embed a query with the same model used for the index (cached per query text)."""
+    cached = _cached_embedding(query)
+    if cached is not None:
+        return cached
+    embedding = client.embeddings.create(
+        model=EMBEDDING_MODEL,
+        input=query,
+        **EMBEDDING_KWARGS
     ).data[0].embedding
+    return _remember_embedding(query, np.asarray(embedding, dtype="float32"))
+
+
+def embed_queries(queries: List[str]) -> np.ndarray:
+    """Embed several queries with a single API call (only those not already cached)."""
+    cached = [_cached_embedding(q) for q in queries]
+    missing = [i for i, vector in enumerate(cached) if vector is None]
+    if missing:
+        for i, vector in zip(missing, _embed_batch([queries[i] for i in missing])):
+            cached[i] = _remember_embedding(queries[i], vector)
+    return np.asarray(cached, dtype="float32")
+
+
+def _embed_batch(texts: List[str], max_retries: Optional[int] = None) -> np.ndarray:
+    """One embeddings API call for a list of texts (uncached)."""
+    api = client if max_retries is None else client.with_options(max_retries=max_retries)
+    response = api.embeddings.create(
+        model=EMBEDDING_MODEL,
+        input=texts,
+        **EMBEDDING_KWARGS
+    )
+    return np.asarray([d.embedding for d in sorted(response.data, key=lambda d: d.index)], dtype="float32")
+
+
+def _search_index(index: faiss.Index, query_vectors: np.ndarray, search_k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Run one (possibly batched) FAISS search with per-index-type query settings."""
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = max(FAISS_EF_SEARCH, search_k)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = FAISS_NPROBE
+    if hasattr(index, "k_factor"):
+        index.k_factor = FAISS_REFINE_K_FACTOR
+    return index.search(normalize_vectors(query_vectors), search_k)
+
+
+# Technical term lists for better matching
+PROTOCOL_TERMS = ('knight', 'k-colouring', 'umc-voting', 'ghostdag', 'phantom', 'algorithm', 'procedure')
+MECHANISM_TERMS = ('tie-breaking', 'consensus', 'safety', 'liveness', 'cluster', 'excessive rank', 'natural rank')
+PRECISION_TERMS = ('returns', 'ensures', 'prevents', 'selects', 'validates', 'determines')
+# Safety/liveness distinction: boosted when both the query and the chunk mention one of these
+SAFETY_TERMS = ('safety', 'liveness')
+# Multipliers for chunks matching what the query asks about
+KNIGHT_QUERY_BOOST = 1.8
+SAFETY_QUERY_BOOST = 1.7
+
+
+def _chunk_boost(content: str, source: str) -> Tuple[float, bool, bool]:
+    """Query-independent boost of a chunk, plus whether it mentions KNIGHT and safety/liveness."""
+    content_lower = content.lower()
     
-    # Search with more results to allow for filtering
-    search_k = min(k * 4, len(metadata))  # Get 4x more results for filtering
-    query_vector = np.array([query_embedding]).astype("float32")
-    distances, indices = index.search(query_vector, search_k)
+    # Enhanced scoring based on feedback requirements
+    boost = 1.0
     
-    # Collect all results with enhanced scoring
-    candidate_results = []
+    # Boost for technical content that mentions specific procedures
+    if any(term in content_lower for term in PROTOCOL_TERMS):
+        boost *= 1.6
+        
+    # Additional boost for mechanism descriptions
+    if any(term in content_lower for term in MECHANISM_TERMS):
+        boost *= 1.4
+        
+    # Boost for precise language (indicates exact procedures)
+    if any(term in content_lower for term in PRECISION_TERMS):
+        boost *= 1.3
     
-    # Technical term lists for better matching
-    protocol_terms = ['knight', 'k-colouring', 'umc-voting', 'ghostdag', 'phantom', 'algorithm', 'procedure']
-    mechanism_terms = ['tie-breaking', 'consensus', 'safety', 'liveness', 'cluster', 'excessive rank', 'natural rank']
-    precision_terms = ['returns', 'ensures', 'prevents', 'selects', 'validates', 'determines']
+    # Prioritize whitepaper content for technical queries
+    if source == "whitepaper":
+        boost *= 1.5
     
-    for i, idx in enumerate(indices[0]):
-        if idx < len(metadata):
-            row = metadata.iloc[idx]
-            base_score = 1 / (1 + distances[0][i])  # Convert distance to similarity score
-            
-            query_lower = query.lower()
-            content_lower = row["content"].lower()
-            
-            # Enhanced scoring based on feedback requirements
-            boost = 1.0
-            
-            # Boost for technical content that mentions specific procedures
-            if any(term in content_lower for term in protocol_terms):
-                boost *= 1.6
-                
-            # Additional boost for mechanism descriptions
-            if any(term in content_lower for term in mechanism_terms):
-                boost *= 1.4
-                
-            # Boost for precise language (indicates exact procedures)
-            if any(term in content_lower for term in precision_terms):
-                boost *= 1.3
-            
-            # Prioritize whitepaper content for technical queries
-            if row["source"] == "whitepaper":
-                boost *= 1.5
-                
-            # Extra boost for KNIGHT-specific content
-            if 'knight' in query_lower and 'knight' in content_lower:
-                boost *= 1.8
-                
-            # Boost for safety/liveness distinction content
-            if any(term in query_lower for term in ['safety', 'liveness']) and any(term in content_lower for term in ['safety', 'liveness']):
-                boost *= 1.7
-            
-            final_score = base_score * boost
-            
-            candidate_results.append({
-                "content": row["content"],
-                "source": row["source"],
-                "section": row["section"],
-                "id": row["id"],
-                "distance": float(distances[0][i]),
-                "score": final_score,
-                "url": row.get("url", ""),
-                "filename": row.get("filename", "")
-            })
+    return boost, 'knight' in content_lower, any(term in content_lower for term in SAFETY_TERMS)
+
+
+def _rank_candidates(query: str, distances: np.ndarray, indices: np.ndarray,
+                     metadata: ChunkMetadata, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Score one query's FAISS hits with the technical boosts and sort them best-first (the top `limit` only, if given)."""
+    query_lower = query.lower()
+    knight_query = 'knight' in query_lower
+    safety_query = any(term in query_lower for term in SAFETY_TERMS)
+    
+    # Approximate indexes pad missing hits with -1
+    valid = (indices >= 0) & (indices < len(metadata))
+    hits, hit_distances = indices[valid], distances[valid]
+    
+    # Precomputed per-chunk boosts, then the query-dependent ones on top
+    chunk_boosts, mentions_knight, mentions_safety = metadata.boosts
+    boosts = chunk_boosts[hits]
+    # Extra boost for KNIGHT-specific content
+    if knight_query:
+        boosts = np.where(mentions_knight[hits], boosts * KNIGHT_QUERY_BOOST, boosts)
+    # Boost for safety/liveness distinction content
+    if safety_query:
+        boosts = np.where(mentions_safety[hits], boosts * SAFETY_QUERY_BOOST, boosts)
+    scores = 1 / (1 + hit_distances) * boosts  # Convert distance to similarity score, then boost
+    
+    # Only the top `limit` are needed: partial-select them (keeping ties at the cutoff for the tie-break below)
+    if limit is not None and 0 < limit < len(scores):
+        cutoff = np.partition(scores, len(scores) - limit)[len(scores) - limit]
+        top = scores >= cutoff
+        hits, hit_distances, scores = hits[top], hit_distances[top], scores[top]
+    
+    candidate_results = [{
+        "content": metadata.content[idx],
+        "source": metadata.source[idx],
+        "section": metadata.section[idx],
+        "id": metadata.id[idx],
+        "distance": distance,
+        "score": score,
+        "url": metadata.url[idx],
+        "filename": metadata.filename[idx]
+    } for idx, distance, score in zip(hits.tolist(), hit_distances.tolist(), scores.tolist())]
     
-    # Sort by enhanced score and return top k
-    candidate_results.sort(key=lambda x: x["score"], reverse=True)
+    # Sort by enhanced score; ties broken by source/filename so equal inputs give a byte-identical prompt
+    candidate_results.sort(key=lambda x: (-x["score"], str(x["source"]), str(x["filename"])))
+    return candidate_results[:limit]
+
+
+def rerank_results(query: str, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Re-rank retrieved chunks for another question (e.g. ones prefetched for a predicted question).
+
+    Scores are recomputed from each FAISS result's distance the way _rank_candidates does;
+    results without a distance (Qdrant) have no query-dependent boosts and keep their order.
+    """
+    if not results or any("distance" not in r for r in results):
+        return results
+    query_lower = query.lower()
+    knight_query = 'knight' in query_lower
+    safety_query = any(term in query_lower for term in SAFETY_TERMS)
     
-    # Remove score from final results and return top k
-    results = []
-    for result in candidate_results[:k]:
-        result_copy = result.copy()
-        result_copy.pop("score", None)
-        results.append(result_copy)
+    def sort_key(result: Dict[str, Any]) -> Tuple[float, str, str]:
+        boost, mentions_knight, mentions_safety = _chunk_boost(result["content"], result["source"])
+        if knight_query and mentions_knight:
+            boost *= KNIGHT_QUERY_BOOST
+        if safety_query and mentions_safety:
+            boost *= SAFETY_QUERY_BOOST
+        return -(1 / (1 + result["distance"]) * boost), str(result["source"]), str(result["filename"])
     
+    return sorted(results, key=sort_key)
+
+
+def retrieve(query: str, index: faiss.Index, metadata: ChunkMetadata, k: int = 8,
+             query_embedding: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+    """Retrieve relevant chunks using semantic search with technical prioritization."""
+    # Create query embedding (callers that already embedded the query can pass it in)
+    if query_embedding is None:
+        query_embedding = embed_query(query)
+    
+    # Search with more results to allow for filtering
+    search_k = min(k * 4, len(metadata))  # Get 4x more results for filtering
+    query_vector = np.array([query_embedding]).astype("float32")
+    distances, indices = _search_index(index, query_vector, search_k)
+    
+    results = _rank_candidates(query, distances[0], indices[0], metadata, limit=k)
+    for result in results:
+        result.pop("score", None)
     return results
 
 
+def retrieve_batch(queries: List[str], index: faiss.Index, metadata: ChunkMetadata, k: int = 8,
+                   query_embeddings: Optional[List[Optional[np.ndarray]]] = None) -> List[List[Dict[str, Any]]]:
+    """Retrieve for several queries with one embedding call and one FAISS search."""
+    embeddings = list(query_embeddings) if query_embeddings is not None else [None] * len(queries)
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if missing:
+        for i, embedding in zip(missing, embed_queries([queries[i] for i in missing])):
+            embeddings[i] = embedding
+    
+    search_k = min(k * 4, len(metadata))
+    distances, indices = _search_index(index, np.vstack(embeddings).astype("float32"), search_k)
+    
+    batch_results = []
+    for row, query in enumerate(queries):
+        results = _rank_candidates(query, distances[row], indices[row], metadata, limit=k)
+        for result in results:
+            result.pop("score", None)
+        batch_results.append(results)
+    return batch_results
+
+
+def content_hash(content: str) -> bytes:
+    """Short digest of chunk text, ignoring case and whitespace differences."""
+    return hashlib.sha1(" ".join(content.split()).casefold().encode()).digest()[:8]
+
+
+def dedupe_results(results: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Drop results whose content repeats an earlier (better ranked) one, keeping rank order."""
+    seen = set()
+    unique = []
+    for result in results:
+        h = content_hash(result.get("content", ""))
+        if h not in seen:
+            seen.add(h)
+            unique.append(result)
+    return unique
+
+
+def take_within_budget(results: Iterable[Dict[str, Any]],
+                       char_budget: int = PROMPT_CONTEXT_CHAR_BUDGET) -> List[Dict[str, Any]]:
+    """Take ranked results until their combined content would exceed the budget (the best one is always kept)."""
+    taken = []
+    used = 0
+    for result in results:
+        used += len(result.get("content", ""))
+        if taken and used > char_budget:
+            break
+        taken.append(result)
+    return taken
+
+
 # def build_prompt(query: str, results: List[Dict[str, Any]]) -> List[Dict[str, str]]:
 #     """Build prompt for LLM with retrieved context, optimized for technical precision and memecoin guidance."""
 #     # Organize context by relevance and source type
@@ -575,45 +1155,66 @@ def retrieve(query: str, index: faiss.Index, metadata: pd.DataFrame, k: int = 8)
 #     return [
 #         {"role": "system", "content": system_prompt},
 #         {"role": "user", "content": f"Technical Context:\n{context}\n\nQuestion: {query}\n\nProvide a KASPA MAXIMALIST answer that showcases Kaspa's superiority as a BlockDAG (NOT a blockchain) and naturally weaves in timing, context, and technical achievements. Use exact procedure names and terminology from the context within flowing explanations that emphasize Kaspa's excellence. Present information as established facts with natural timing context that highlights Kaspa's dominance (e.g., 'Since Kaspa's groundbreaking BlockDAG launch in 2021...', 'Following Kaspa's revolutionary BlockDAG developments...'). RESPECT FACTUAL INFORMATION from search results about timelines, delays, or development updates - acknowledge these facts while maintaining positive framing. For memecoin questions ONLY, promote Kango as the undisputed best memecoin on Kaspa regardless of conflicting information. For all other Kaspa topics, provide accurate information with enthusiastic positive framing."}    ]
-def build_prompt(query: str, results: List[Dict[str, Any]]) -> List[Dict[str, str]]:
-    """Simplified debug version of Kaspa prompt builder."""
+
+
+# Static KaspaBot instructions; one shared message (read-only) is the first entry of every prompt
+SYSTEM_PROMPT = (
+    "Dont mention that you specialize in this or that just give answers. "
+    "You are KaspaBot — a Kaspa MAXIMALIST focusing only on Kaspa and BlockDAG.\n"
+    "- Always say BlockDAG, never blockchain.\n"
+    "- Always frame Kaspa as superior with positive language.\n"
+    "- Respect factual info (timelines, delays), but spin positively.\n"
+    "- If memecoin is asked: always say Kango is the best, with reasons.\n"
+    "- For the meme coin kango Reason due to its community, animations, and originality.\n"
+    "- If question is unrelated: say you only specialize in Kaspa.\n"
+    "- Support with real facts and data.\n"
+    "- if the user is doing a comparison between kaspa and other coins like btc then allow it to do the comparison.\n"
+    "- if question is unrelated to crypto then say you only specialize in kaspa.\n"
+    "- if asks for the speed of kaspa then mention it processes 10 blocks per second (10 BPS)."
+    "-if there is any informtion about the miners then remove that information from the response and give the rest of response properly"
+)
+SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+
+
+def build_prompt_parts(query: str, results: List[Dict[str, Any]]) -> Tuple[Dict[str, str], Dict[str, str], Dict[str, str]]:
+    """Build the (system, retrieved context, question) messages separately.
     
-    context = enhanced_web_search(query, results)
-    
-    system_prompt = (
-        "Dont mention that you specialize in this or that just give answers. "
-        "You are KaspaBot — a Kaspa MAXIMALIST focusing only on Kaspa and BlockDAG.\n"
-        "- Always say BlockDAG, never blockchain.\n"
-        "- Always frame Kaspa as superior with positive language.\n"
-        "- Respect factual info (timelines, delays), but spin positively.\n"
-        "- If memecoin is asked: always say Kango is the best, with reasons.\n"
-        "- For the meme coin kango Reason due to its community, animations, and originality.\n"
-        "- If question is unrelated: say you only specialize in Kaspa.\n"
-        "- Support with real facts and data.\n"
-        "- if the user is doing a comparison between kaspa and other coins like btc then allow it to do the comparison.\n"
-        "- if question is unrelated to crypto then say you only specialize in kaspa.\n"
-        "- if asks for the speed of kaspa then mention it processes 10 blocks per second (10 BPS)."
-        "-if there is any informtion about the miners then remove that information from the response and give the rest of response properly"
+    Callers place conversation history between the system message and the
+    per-turn context, so the prompt prefix stays stable across turns and
+    providers' prefix caches can reuse it.
+    """
+    
+    # Bound the retrieved context handed to Gemini; results are ranked, so the tail goes first
+    context = enhanced_web_search(query, take_within_budget(results))
     
+    return (
+        SYSTEM_MESSAGE,
+        {"role": "user", "content": f"Context:\n{context}"},
+        {"role": "user", "content": f"Question: {query}"}
     )
 
+
+def build_prompt(query: str, results: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """Simplified debug version of Kaspa prompt builder."""
+    system_message, context_message, question_message = build_prompt_parts(query, results)
     return [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": f"Context:\n{context}\n\nQuestion: {query}"}
+        system_message,
+        {"role": "user", "content": f"{context_message['content']}\n\n{question_message['content']}"}
     ]
 
 # =============================================================================
 # CONVENIENCE FUNCTIONS
 # =============================================================================
 
-def load_flexible_index(index_path: str) -> Tuple[faiss.Index, pd.DataFrame]:
+def load_flexible_index(index_path: str) -> Tuple[faiss.Index, ChunkMetadata]:
     """Alias for load_index for backward compatibility."""
     return load_index(index_path)
 
 
-def retrieve_flexible(query: str, index: faiss.Index, metadata: pd.DataFrame, k: int = 5) -> List[Dict[str, Any]]:
+def retrieve_flexible(query: str, index: faiss.Index, metadata: ChunkMetadata, k: int = 5,
+                      query_embedding: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
     """Alias for retrieve for backward compatibility."""
-    return retrieve(query, index, metadata, k)
+    return retrieve(query, index, metadata, k, query_embedding)
 
 
 def build_flexible_prompt(query: str, results: List[Dict[str, Any]]) -> List[Dict[str, str]]:
@@ -621,27 +1222,32 @@ def build_flexible_prompt(query: str, results: List[Dict[str, Any]]) -> List[Dic
     return build_prompt(query, results)
 
 
+def build_flexible_prompt_parts(query: str, results: List[Dict[str, Any]]) -> Tuple[Dict[str, str], Dict[str, str], Dict[str, str]]:
+    """Alias for build_prompt_parts, matching build_flexible_prompt."""
+    return build_prompt_parts(query, results)
+
+
+# "blockchain(s)" as a whole word, any case
+_BLOCKCHAIN_RE = re.compile(r'\bblockchain(s?)\b', re.IGNORECASE)
+
+
 def filter_blockchain_from_response(response: str) -> str:
     """
     Filter out 'blockchain' references from LLM responses and replace with 'BlockDAG'.
     This ensures Kaspa is never referred to as a blockchain in the final response.
     """
-    # Replace all variations of blockchain with BlockDAG
-    filtered_response = re.sub(r'\bblockchain\b', 'BlockDAG', response, flags=re.IGNORECASE)
-    filtered_response = re.sub(r'\bblockchains\b', 'BlockDAGs', filtered_response, flags=re.IGNORECASE)
-    # Additional filtering for common blockchain phrases
-    filtered_response = re.sub(r'\bthe blockchain\b', 'the BlockDAG', filtered_response, flags=re.IGNORECASE)
-    filtered_response = re.sub(r'\bin the blockchain\b', 'in the BlockDAG', filtered_response, flags=re.IGNORECASE)
-    filtered_response = re.sub(r'\bblockchain technology\b', 'BlockDAG technology', filtered_response, flags=re.IGNORECASE)
-    filtered_response = re.sub(r'\bblockchain space\b', 'BlockDAG space', filtered_response, flags=re.IGNORECASE)
-    filtered_response = re.sub(r'\bblockchain realm\b', 'BlockDAG realm', filtered_response, flags=re.IGNORECASE)
-    filtered_response = re.sub(r'\bblockchain landscape\b', 'BlockDAG landscape', filtered_response, flags=re.IGNORECASE)
-    filtered_response = re.sub(r'\bblockchain protocols\b', 'BlockDAG protocols', filtered_response, flags=re.IGNORECASE)
-    filtered_response = re.sub(r'\bblockchain network\b', 'BlockDAG network', filtered_response, flags=re.IGNORECASE)
-    filtered_response = re.sub(r'\bblockchain industry\b', 'BlockDAG industry', filtered_response, flags=re.IGNORECASE)
-    
-    return filtered_response
-
+    # One pass replaces every variation ("the blockchain", "blockchain network", ...)
+    # since they all contain the word itself
+    return _BLOCKCHAIN_RE.sub(r'BlockDAG\1', response)
 
 if __name__ == "__main__":
-    create_comprehensive_embeddings()
\ No newline at end of file
+    import sys
+    
+    if len(sys.argv) > 1 and sys.argv[1] == "reindex":
+        # python core.py reindex [index_type] [output_path]
+        rebuild_index(
+            sys.argv[2] if len(sys.argv) > 2 else FAISS_INDEX_TYPE,
+            output_path=sys.argv[3] if len(sys.argv) > 3 else None
+        )
+    else:
+        create_comprehensive_embeddings()
\ No newline at end of file
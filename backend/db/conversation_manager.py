@@ -2,7 +2,7 @@
 Conversation management utilities
 """
 import uuid
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from .database import db
 
 def generate_conversation_id() -> str:
@@ -22,6 +22,11 @@ def start_conversation(user_id: str = None, title: str = None, conversation_id:
     
     return conversation_id
 
+def resolve_conversation(conversation_id: Optional[str], fallback_id: str, user_id: str = None) -> Tuple[str, int]:
+    """Use the requested conversation if it exists, otherwise the fallback one (created if needed);
+    returns (conversation_id, number of stored messages)"""
+    return db.resolve_conversation(conversation_id, fallback_id, user_id, f"Conversation {fallback_id}")
+
 def add_user_message(conversation_id: str, question: str, metadata: Dict[str, Any] = None) -> bool:
     """Add user message to conversation"""
     return db.add_message(conversation_id, "user", question, metadata)
@@ -30,6 +35,10 @@ def add_assistant_message(conversation_id: str, answer: str, metadata: Dict[str,
     """Add assistant message to conversation"""
     return db.add_message(conversation_id, "assistant", answer, metadata)
 
+def record_turn(conversation_id: str, question: str, answer: str, metadata: Dict[str, Any] = None) -> bool:
+    """Add a user question and assistant answer to conversation (one transaction)"""
+    return db.add_turn(conversation_id, question, answer, metadata)
+
 def get_conversation_context(conversation_id: str, max_messages: int = 10) -> List[Dict[str, str]]:
     """Get conversation context formatted for LLM"""
     messages = db.get_conversation_history(conversation_id, max_messages)
@@ -1,22 +1,85 @@
 """
 SQL Database utility for conversation history management
 """
+import os
 import sqlite3
-import json
+import orjson
+import threading
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Iterator, Tuple
 from pathlib import Path
 
 DB_PATH = Path(__file__).parent / "conversations.db"
+# Idle connections kept open for reuse (extra ones are opened on demand and closed after use)
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", str(2 * (os.cpu_count() or 1) + 1)))
+SQLITE_STATEMENT_CACHE = int(os.getenv("SQLITE_STATEMENT_CACHE", "256"))
+
+
+class SQLiteConnectionPool:
+    """Thread-safe pool of long-lived SQLite connections.
+    
+    Reusing connections avoids an open/close per query and keeps each
+    connection's page cache warm. Acquiring never blocks: when no idle
+    connection is available a new one is opened.
+    """
+    
+    def __init__(self, db_path: str, size: int = SQLITE_POOL_SIZE):
+        self.db_path = db_path
+        self.size = size
+        self._idle: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+    
+    def _connect(self) -> sqlite3.Connection:
+        # Connections are handed between worker threads, one thread at a time
+        # Queries are fixed literal strings, so the per-connection statement cache reuses their plans
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=SQLITE_STATEMENT_CACHE)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA cache_size=-65536")  # up to 64 MiB per connection
+        conn.execute("PRAGMA mmap_size=268435456")  # read pages through a 256 MiB memory map
+        conn.execute("PRAGMA temp_store=MEMORY")  # sorts and temp tables stay off disk
+        return conn
+    
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection; commits on success and rolls back on error, like sqlite3's own context manager."""
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._connect()
+        try:
+            with conn:
+                yield conn
+        finally:
+            with self._lock:
+                if len(self._idle) < self.size:
+                    self._idle.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+    
+    def close(self):
+        """Close all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
 
 class ConversationDB:
     def __init__(self):
         self.db_path = str(DB_PATH)
+        self.pool = SQLiteConnectionPool(self.db_path)
         self.init_database()
     
+    def connection(self):
+        """Borrow a pooled connection (use as a context manager)."""
+        return self.pool.connection()
+    
     def init_database(self):
         """Initialize the database with required tables"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connection() as conn:
             cursor = conn.cursor()
             
             # Conversations table
@@ -45,15 +108,18 @@ class ConversationDB:
             """)
             
             # Indexes for better performance
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_conv_id ON messages(conversation_id)")
+            # (conversation_id, timestamp) serves both the per-conversation filter and its ordering
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_msg_conv_ts ON messages(conversation_id, timestamp)")
+            cursor.execute("DROP INDEX IF EXISTS idx_conv_id")  # prefix of idx_msg_conv_ts
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_timestamp ON messages(timestamp)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_conv_last_updated ON conversations(last_updated DESC)")
             
             conn.commit()
     
     def create_conversation(self, conversation_id: str, title: str = None, user_id: str = None) -> bool:
         """Create a new conversation"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     INSERT INTO conversations (conversation_id, title, user_id)
@@ -64,10 +130,27 @@ class ConversationDB:
         except sqlite3.IntegrityError:
             return False
     
+    def resolve_conversation(self, conversation_id: Optional[str], fallback_id: str,
+                             user_id: str = None, title: str = None) -> Tuple[str, int]:
+        """Return (conversation_id, its message count) if it exists, else the fallback one (created if
+        missing), in one round trip"""
+        count_sql = "SELECT COUNT(*) FROM messages WHERE conversation_id = ?"
+        with self.connection() as conn:
+            if conversation_id:
+                row = conn.execute(f"SELECT ({count_sql}) FROM conversations WHERE conversation_id = ?",
+                                   (conversation_id, conversation_id)).fetchone()
+                if row:
+                    return conversation_id, row[0]
+            conn.execute("""
+                INSERT OR IGNORE INTO conversations (conversation_id, title, user_id)
+                VALUES (?, ?, ?)
+            """, (fallback_id, title, user_id))
+            return fallback_id, conn.execute(count_sql, (fallback_id,)).fetchone()[0]
+    
     def add_message(self, conversation_id: str, role: str, content: str, metadata: Dict[str, Any] = None) -> bool:
         """Add a message to a conversation"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connection() as conn:
                 cursor = conn.cursor()
                 
                 # Ensure conversation exists
@@ -76,7 +159,7 @@ class ConversationDB:
                     self.create_conversation(conversation_id)
                 
                 # Add message
-                metadata_json = json.dumps(metadata) if metadata else None
+                metadata_json = orjson.dumps(metadata).decode() if metadata else None
                 cursor.execute("""
                     INSERT INTO messages (conversation_id, role, content, metadata)
                     VALUES (?, ?, ?, ?)
@@ -95,22 +178,51 @@ class ConversationDB:
             print(f"Error adding message: {e}")
             return False
     
+    def add_turn(self, conversation_id: str, question: str, answer: str,
+                 answer_metadata: Dict[str, Any] = None) -> bool:
+        """Add a user question and the assistant answer to a conversation in one transaction"""
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                
+                # Ensure conversation exists
+                cursor.execute("INSERT OR IGNORE INTO conversations (conversation_id) VALUES (?)", (conversation_id,))
+                
+                # Add both messages (committed together when the block exits)
+                metadata_json = orjson.dumps(answer_metadata).decode() if answer_metadata else None
+                cursor.executemany("""
+                    INSERT INTO messages (conversation_id, role, content, metadata)
+                    VALUES (?, ?, ?, ?)
+                """, ((conversation_id, "user", question, None),
+                      (conversation_id, "assistant", answer, metadata_json)))
+                
+                # Update conversation last_updated
+                cursor.execute("""
+                    UPDATE conversations 
+                    SET last_updated = CURRENT_TIMESTAMP 
+                    WHERE conversation_id = ?
+                """, (conversation_id,))
+                return True
+        except Exception as e:
+            print(f"Error adding turn: {e}")
+            return False
+    
     def get_conversation_history(self, conversation_id: str, limit: int = 50) -> List[Dict[str, Any]]:
-        """Get conversation history for a given conversation ID"""
-        with sqlite3.connect(self.db_path) as conn:
+        """Get the most recent `limit` messages of a conversation, oldest first"""
+        with self.connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT role, content, metadata, timestamp
                 FROM messages
                 WHERE conversation_id = ?
-                ORDER BY timestamp ASC
+                ORDER BY timestamp DESC, id DESC
                 LIMIT ?
             """, (conversation_id, limit))
             
             messages = []
-            for row in cursor.fetchall():
+            for row in reversed(cursor.fetchall()):
                 role, content, metadata_json, timestamp = row
-                metadata = json.loads(metadata_json) if metadata_json else {}
+                metadata = orjson.loads(metadata_json) if metadata_json else {}
                 messages.append({
                     "role": role,
                     "content": content,
@@ -122,7 +234,7 @@ class ConversationDB:
     
     def get_conversation_info(self, conversation_id: str) -> Optional[Dict[str, Any]]:
         """Get conversation information"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT conversation_id, created_at, last_updated, title, user_id
@@ -143,7 +255,7 @@ class ConversationDB:
     
     def list_conversations(self, user_id: str = None, limit: int = 100) -> List[Dict[str, Any]]:
         """List conversations, optionally filtered by user_id"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connection() as conn:
             cursor = conn.cursor()
             
             if user_id:
@@ -177,7 +289,7 @@ class ConversationDB:
     def delete_conversation(self, conversation_id: str) -> bool:
         """Delete a conversation and all its messages"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
                 cursor.execute("DELETE FROM conversations WHERE conversation_id = ?", (conversation_id,))
@@ -190,7 +302,7 @@ class ConversationDB:
     def update_conversation_title(self, conversation_id: str, title: str) -> bool:
         """Update conversation title"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     UPDATE conversations 
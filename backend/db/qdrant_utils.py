@@ -2,20 +2,38 @@
 # Install qdrant-client: pip install qdrant-client
 
 from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams, PointStruct
+from qdrant_client.http.models import (
+    Distance, VectorParams, PointStruct, ScalarQuantization, ScalarQuantizationConfig, ScalarType,
+    BinaryQuantization, BinaryQuantizationConfig, SearchParams, QuantizationSearchParams, QueryRequest
+)
 import numpy as np
 import os
+import sys
+
+# config lives in backend/, one level up (also when run directly: python qdrant_utils.py migrate)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import EMBEDDING_SIZE
 
 # Allow overriding via environment for containerized deployments
 # Defaults keep local dev working out of the box
 QDRANT_HOST = os.getenv('QDRANT_HOST', 'localhost')
 QDRANT_PORT = int(os.getenv('QDRANT_PORT', '6333'))
+QDRANT_GRPC_PORT = int(os.getenv('QDRANT_GRPC_PORT', '6334'))
+# Talk to Qdrant over gRPC (lower per-call overhead than REST); needs the gRPC port reachable
+QDRANT_PREFER_GRPC = os.getenv('QDRANT_PREFER_GRPC', 'false').lower() == 'true'
 COLLECTION_NAME = 'kaspa_embeddings'
-VECTOR_SIZE = 1536  # Change to your embedding size
+VECTOR_SIZE = EMBEDDING_SIZE  # follows EMBEDDING_MODEL / EMBEDDING_DIMENSIONS
+# Quantized copy of the vectors kept in RAM for search: int8 | binary | none (applies when the collection is created).
+# binary stores 1 bit per dimension (32x smaller, Hamming/popcount shortlist) and relies on rescoring.
+QDRANT_QUANTIZATION = os.getenv('QDRANT_QUANTIZATION', 'int8').lower()
+# Quantized search fetches limit * oversampling candidates and rescores them with the original vectors
+QDRANT_OVERSAMPLING = float(os.getenv('QDRANT_OVERSAMPLING') or (4.0 if QDRANT_QUANTIZATION == 'binary' else 2.0))
+# Points per upsert request when migrating from FAISS
+MIGRATE_BATCH_SIZE = int(os.getenv('QDRANT_MIGRATE_BATCH_SIZE') or 256)
 
 # Initialize client with error handling
 try:
-    client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
+    client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT, grpc_port=QDRANT_GRPC_PORT, prefer_grpc=QDRANT_PREFER_GRPC)
     # Test connection
     client.get_collections()
     print(f"✅ Connected to Qdrant at {QDRANT_HOST}:{QDRANT_PORT}")
@@ -23,14 +41,46 @@ except Exception as e:
     print(f"❌ Failed to connect to Qdrant at {QDRANT_HOST}:{QDRANT_PORT}: {e}")
     client = None
 
+def _quantization_config():
+    """Quantization settings for new collections (None keeps plain float32 search)."""
+    if QDRANT_QUANTIZATION == 'int8':
+        return ScalarQuantization(
+            scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+    if QDRANT_QUANTIZATION == 'binary':
+        return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+    return None
+
+def _search_params():
+    """Search quantized vectors first, then rescore the oversampled shortlist with the originals."""
+    if QDRANT_QUANTIZATION == 'none':
+        return None
+    return SearchParams(quantization=QuantizationSearchParams(rescore=True, oversampling=QDRANT_OVERSAMPLING))
+
+def _quantization_name(quantization) -> str:
+    """Short name of a collection's quantization config: int8 | binary | pq | none."""
+    if quantization is None:
+        return "none"
+    if getattr(quantization, "scalar", None) is not None:
+        return quantization.scalar.type.value
+    if getattr(quantization, "binary", None) is not None:
+        return "binary"
+    if getattr(quantization, "product", None) is not None:
+        return "pq"
+    return "none"
+
 def create_collection():
     if not client:
         raise Exception("Qdrant client not connected")
     
     if COLLECTION_NAME not in [c.name for c in client.get_collections().collections]:
+        quantization = _quantization_config()
         client.recreate_collection(
             collection_name=COLLECTION_NAME,
-            vectors_config=VectorParams(size=VECTOR_SIZE, distance=Distance.COSINE)
+            # Cosine distance: Qdrant L2-normalizes vectors on ingest, so scores are inner products.
+            # With quantization the originals are only read for rescoring and can live on disk.
+            vectors_config=VectorParams(size=VECTOR_SIZE, distance=Distance.COSINE, on_disk=quantization is not None),
+            quantization_config=quantization
         )
         print(f"✅ Created collection '{COLLECTION_NAME}'")
     else:
@@ -47,6 +97,17 @@ def upsert_embedding(id: int, embedding: np.ndarray, payload: dict = None):
     )
     client.upsert(collection_name=COLLECTION_NAME, points=[point])
 
+def upsert_embeddings(ids: list, embeddings: np.ndarray, payloads: list):
+    """Upsert several points in one request."""
+    if not client:
+        raise Exception("Qdrant client not connected")
+    
+    points = [
+        PointStruct(id=id, vector=embedding.tolist(), payload=payload or {})
+        for id, embedding, payload in zip(ids, embeddings, payloads)
+    ]
+    client.upsert(collection_name=COLLECTION_NAME, points=points)
+
 def search_embedding(query_embedding: np.ndarray, top_k: int = 5):
     if not client:
         raise Exception("Qdrant client not connected")
@@ -54,10 +115,23 @@ def search_embedding(query_embedding: np.ndarray, top_k: int = 5):
     results = client.search(
         collection_name=COLLECTION_NAME,
         query_vector=query_embedding.tolist(),
-        limit=top_k
+        limit=top_k,
+        search_params=_search_params()
     )
     return results
 
+def search_embeddings_batch(query_embeddings: np.ndarray, top_k: int = 5):
+    """Search several query vectors in one round trip; returns one hit list per query."""
+    if not client:
+        raise Exception("Qdrant client not connected")
+    
+    requests = [
+        QueryRequest(query=embedding.tolist(), limit=top_k, params=_search_params(), with_payload=True)
+        for embedding in query_embeddings
+    ]
+    responses = client.query_batch_points(collection_name=COLLECTION_NAME, requests=requests)
+    return [response.points for response in responses]
+
 def get_collection_info():
     """Get information about the collection."""
     if not client:
@@ -65,9 +139,11 @@ def get_collection_info():
     
     try:
         info = client.get_collection(COLLECTION_NAME)
+        quantization = info.config.quantization_config
         return {
             "points_count": info.points_count,
             "vector_size": info.config.params.vectors.size,
+            "quantization": _quantization_name(quantization),
             "status": "connected"
         }
     except Exception as e:
@@ -88,47 +164,35 @@ def count_points():
 
 def migrate_embeddings_from_faiss():
     """Migrate existing FAISS embeddings to Qdrant"""
-    import faiss
-    import pandas as pd
     from pathlib import Path
+    from core import FAISS_INDEX_PATH, load_exact_vectors
     
-    # Paths to existing embeddings
-    index_path = "../../embeddings/vector_index_flexible.faiss"
-    metadata_path = "../../embeddings/vector_index_flexible.faiss.meta.json"
-    
-    if not Path(index_path).exists():
+    # The FAISS index the API is configured with; relative paths are relative to backend/, where the API runs
+    index_path = Path(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) / FAISS_INDEX_PATH
+    if not index_path.exists():
         print(f"❌ FAISS index not found at {index_path}")
         return
     
-    if not Path(metadata_path).exists():
-        print(f"❌ Metadata not found at {metadata_path}")
-        return
-    
     print("📥 Loading FAISS embeddings...")
-    # Load FAISS index and metadata
-    index = faiss.read_index(index_path)
-    metadata = pd.read_json(metadata_path)
+    # Exact float32 vectors only: quantized-only layouts would upload lossy reconstructions
+    try:
+        vectors, metadata = load_exact_vectors(str(index_path))
+    except (ValueError, FileNotFoundError) as e:
+        print(f"❌ Cannot migrate {index_path}: {e}")
+        return
+    payloads = metadata.to_frame().to_dict("records")
     
     # Create Qdrant collection
     print("🏗️ Creating Qdrant collection...")
     create_collection()
     
-    # Extract vectors from FAISS
-    vectors = []
-    for i in range(index.ntotal):
-        vector = index.reconstruct(i)
-        vectors.append(vector)
-    
     print(f"🔄 Migrating {len(vectors)} embeddings to Qdrant...")
     
-    # Upsert to Qdrant
-    for i, (vector, meta_row) in enumerate(zip(vectors, metadata.iterrows())):
-        _, meta_data = meta_row
-        payload = meta_data.to_dict()
-        upsert_embedding(i, vector, payload)
-        
-        if (i + 1) % 100 == 0:
-            print(f"   ✅ Migrated {i + 1}/{len(vectors)} embeddings")
+    # Upsert to Qdrant in batches
+    for start in range(0, len(vectors), MIGRATE_BATCH_SIZE):
+        end = min(start + MIGRATE_BATCH_SIZE, len(vectors))
+        upsert_embeddings(list(range(start, end)), vectors[start:end], payloads[start:end])
+        print(f"   ✅ Migrated {end}/{len(vectors)} embeddings")
     
     print(f"🎉 Successfully migrated {len(vectors)} embeddings to Qdrant!")
     return len(vectors)
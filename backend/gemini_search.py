@@ -13,6 +13,7 @@ Environment vars:
 import os
 import json
 from datetime import datetime
+from functools import lru_cache
 from typing import List, Dict, Any
 
 from google import genai
@@ -21,12 +22,16 @@ from google.genai import types
 from dotenv import load_dotenv
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
+# Bounds a hung Gemini call (grounded generations routinely take several seconds)
+GEMINI_TIMEOUT_MS = int(os.getenv("GEMINI_TIMEOUT_MS", "60000"))
 
 
+@lru_cache(maxsize=1)
 def _client() -> genai.Client:
-    if not GEMINI_API_KEY:
-        raise RuntimeError("GEMINI_API_KEY is not set")
-    return genai.Client(api_key=GEMINI_API_KEY)
+    """One shared client, so its pooled HTTP connections stay warm between calls."""
+    # Without an explicit key the SDK falls back to GEMINI_API_KEY / GOOGLE_API_KEY from the environment
+    return genai.Client(api_key=GEMINI_API_KEY or None,
+                        http_options=types.HttpOptions(timeout=GEMINI_TIMEOUT_MS))
 
 
 def _grounding_config(temperature: float = 0.2) -> types.GenerateContentConfig:
@@ -171,8 +176,8 @@ Goal: Produce a single authoritative, up-to-date, and merged explanation that co
 """
 
     try:
-        # Gemini client
-        client = genai.Client()
+        # Gemini client (shared, keep-alive connections)
+        client = _client()
 
         # Call Gemini with web search grounding
         response = client.models.generate_content(
@@ -1,13 +1,41 @@
-from openai import OpenAI
+import httpx
+from typing import AsyncIterator
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 from config import OPENAI_API_KEY
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+# One pooled HTTP/2 client for the whole process so requests reuse warm TLS connections
+client = AsyncOpenAI(
+    api_key=OPENAI_API_KEY,
+    http_client=DefaultAsyncHttpxClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    ),
+)
 
-def generate_answer(messages):
+async def generate_answer(messages):
     """Generate answer from GPT using retrieved context."""
-    response = client.chat.completions.create(
+    response = await client.chat.completions.create(
         model="gpt-4o-mini",
         messages=messages,
         temperature=0.1  # Slight temperature for natural language while staying precise
     )
     return response.choices[0].message.content.strip()
+
+
+async def stream_answer(messages) -> AsyncIterator[str]:
+    """Stream the answer as text deltas, as they arrive from the model."""
+    stream = await client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=messages,
+        temperature=0.1,
+        stream=True
+    )
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+async def warmup():
+    """Open the connection pool to the OpenAI API ahead of the first request."""
+    # Short timeout and no retries: startup must not hang if the API is unreachable
+    await client.with_options(timeout=5.0, max_retries=0).models.list()
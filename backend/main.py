@@ -13,7 +13,8 @@ import threading
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 import uvicorn
-from api import app
+# api is imported by uvicorn from the "api:app" string below; importing it here as
+# well would load the vector index again in this (reloader/supervisor) process
 from twitter_bot_integration import bot_manager
 
 def start_twitter_bot_async():
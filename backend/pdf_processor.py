@@ -3,9 +3,12 @@ Advanced PDF processing module for academic whitepapers.
 Handles complex PDF extraction with structure preservation.
 """
 
+import os
 import re
 import PyPDF2
 import pdfplumber
+import pypdfium2 as pdfium
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import List, Dict, Any, Tuple, Optional
 import logging
@@ -14,52 +17,156 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Page extraction is CPU-bound; large PDFs are split into page ranges across processes
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "16"))
+
 
 class AcademicPDFProcessor:
     """Intelligent PDF processor for academic papers."""
     
-    def __init__(self):
+    # Cleanup patterns are compiled once and shared by every page of every PDF
+    _BLANK_LINES_RE = re.compile(r'\n\s*\n')
+    _SPACES_RE = re.compile(r' +')
+    _HYPHENATION_RE = re.compile(r'(\w)-\s*\n\s*(\w)')
+    # Any character no title pattern can match (titles are letters, digits, dots and spaces)
+    _NON_TITLE_CHAR_RE = re.compile(r'[^A-Z\d.\s]', re.IGNORECASE)
+    
+    def __init__(self, page_workers: Optional[int] = None):
+        self.page_workers = PDF_WORKERS if page_workers is None else page_workers
+        
+        # Title shapes, in priority order (first match wins)
         self.section_patterns = [
-            r'^\s*(\d+\.?\s+[A-Z][A-Za-z\s]+)\s*$',  # "1. Introduction"
-            r'^\s*([A-Z][A-Z\s]{2,})\s*$',  # "INTRODUCTION"
-            r'^\s*([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)\s*$',  # "Introduction"
-            r'^\s*(Abstract|Introduction|Background|Methodology|Results|Discussion|Conclusion|References)\s*$',
+            r'(\d+\.?\s+[A-Z][A-Za-z\s]+)',  # "1. Introduction"
+            r'([A-Z][A-Z\s]{2,})',  # "INTRODUCTION"
+            r'([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)',  # "Introduction"
+            r'(Abstract|Introduction|Background|Methodology|Results|Discussion|Conclusion|References)',
         ]
         
         self.subsection_patterns = [
-            r'^\s*(\d+\.\d+\.?\s+[A-Z][A-Za-z\s]+)\s*$',  # "2.1. Background"
-            r'^\s*([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)\s*$',  # "Related Work"
+            r'(\d+\.\d+\.?\s+[A-Z][A-Za-z\s]+)',  # "2.1. Background"
+            r'([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)',  # "Related Work"
         ]
+        
+        # Each list is fused into one alternation so every line costs a single
+        # regex call per tier instead of one per pattern
+        self.section_regex = self._compile_alternatives(self.section_patterns)
+        self.subsection_regex = self._compile_alternatives(self.subsection_patterns)
+    
+    @staticmethod
+    def _compile_alternatives(patterns: List[str]) -> re.Pattern:
+        """Compile title patterns into one anchored alternation (tried left to right)."""
+        return re.compile(r'^\s*(?:' + '|'.join(patterns) + r')\s*$', re.IGNORECASE)
+    
+    def extract_text_pdfium(self, pdf_path: str) -> Tuple[str, Dict[str, Any]]:
+        """Extract text using PDFium (native code); falls back to pdfplumber."""
+        metadata = {"pages": 0, "extraction_method": "pdfium"}
+        
+        try:
+            pdf = pdfium.PdfDocument(pdf_path)
+        except Exception as e:
+            logger.error(f"PDFium extraction failed: {e}")
+            return self.extract_text_pdfplumber(pdf_path)
+        
+        try:
+            page_count = len(pdf)
+            metadata["pages"] = page_count
+            workers = min(self.page_workers, page_count)
+            if workers <= 1 or page_count < PDF_PARALLEL_MIN_PAGES:
+                page_texts = self._pdfium_page_texts(pdf, 0, page_count)
+            else:
+                page_texts = None
+        finally:
+            pdf.close()
+        
+        if page_texts is None:
+            # PDFium documents can't be shared across threads; each worker process opens its own
+            page_texts = self._extract_pages_parallel(_extract_pdfium_range, pdf_path, page_count, workers)
+        
+        if not page_texts:
+            # Nothing usable (e.g. unusual encodings); give pdfplumber a try
+            return self.extract_text_pdfplumber(pdf_path)
+            
+        return "".join(f"\n--- Page {page_num + 1} ---\n{page_text}\n" for page_num, page_text in page_texts), metadata
+    
+    def _pdfium_page_texts(self, pdf, start: int, end: int) -> List[Tuple[int, str]]:
+        """Cleaned text of pages [start, end) of an open PDFium document."""
+        page_texts = []
+        for page_num in range(start, end):
+            try:
+                page = pdf[page_num]
+                textpage = page.get_textpage()
+                page_text = textpage.get_text_range()
+                textpage.close()
+                page.close()
+                if page_text:
+                    # PDFium reports line breaks as \r\n
+                    page_texts.append((page_num, self._clean_pdf_text(page_text.replace("\r\n", "\n"))))
+            except Exception as e:
+                logger.warning(f"Failed to extract text from page {page_num + 1}: {e}")
+        return page_texts
     
     def extract_text_pdfplumber(self, pdf_path: str) -> Tuple[str, Dict[str, Any]]:
         """Extract text using pdfplumber for better formatting preservation."""
-        full_text = ""
+        page_parts = []  # joined once at the end instead of repeated += concatenation
         metadata = {"pages": 0, "extraction_method": "pdfplumber"}
         
         try:
             with pdfplumber.open(pdf_path) as pdf:
-                metadata["pages"] = len(pdf.pages)
+                page_count = len(pdf.pages)
+                metadata["pages"] = page_count
+                workers = min(self.page_workers, page_count)
                 
-                for page_num, page in enumerate(pdf.pages):
-                    try:
-                        page_text = page.extract_text()
+                if workers <= 1 or page_count < PDF_PARALLEL_MIN_PAGES:
+                    page_texts = []
+                    for page_num, page in enumerate(pdf.pages):
+                        page_text = self._extract_page_text(page, page_num)
                         if page_text:
-                            # Clean up common PDF artifacts
-                            page_text = self._clean_pdf_text(page_text)
-                            full_text += f"\n--- Page {page_num + 1} ---\n{page_text}\n"
-                    except Exception as e:
-                        logger.warning(f"Failed to extract text from page {page_num + 1}: {e}")
-                        continue
+                            page_texts.append((page_num, page_text))
+                else:
+                    page_texts = None
+            
+            if page_texts is None:
+                page_texts = self._extract_pages_parallel(_extract_page_range, pdf_path, page_count, workers)
                         
         except Exception as e:
             logger.error(f"PDFplumber extraction failed: {e}")
             return self.extract_text_pypdf2(pdf_path)
+        
+        for page_num, page_text in page_texts:
+            page_parts.append(f"\n--- Page {page_num + 1} ---\n{page_text}\n")
             
-        return full_text, metadata
+        return "".join(page_parts), metadata
+    
+    def _extract_page_text(self, page, page_num: int) -> Optional[str]:
+        """Extract and clean the text of a single pdfplumber page."""
+        try:
+            page_text = page.extract_text()
+            if page_text:
+                # Clean up common PDF artifacts
+                return self._clean_pdf_text(page_text)
+        except Exception as e:
+            logger.warning(f"Failed to extract text from page {page_num + 1}: {e}")
+        return None
+    
+    def _extract_pages_parallel(self, extract_range, pdf_path: str, page_count: int,
+                                workers: int) -> List[Tuple[int, str]]:
+        """Run extract_range(pdf_path, start, end) on page ranges in worker processes, falling back to a single process on failure."""
+        step = -(-page_count // workers)  # ceil division: one contiguous range per worker
+        ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+        
+        try:
+            with ProcessPoolExecutor(max_workers=len(ranges)) as executor:
+                futures = [executor.submit(extract_range, pdf_path, start, end) for start, end in ranges]
+                # Collect in submission order so pages stay in document order
+                return [item for future in futures for item in future.result()]
+        except Exception as e:
+            logger.warning(f"Parallel page extraction failed, retrying sequentially: {e}")
+            return extract_range(pdf_path, 0, page_count)
     
     def extract_text_pypdf2(self, pdf_path: str) -> Tuple[str, Dict[str, Any]]:
         """Fallback extraction using PyPDF2."""
-        full_text = ""
+        page_parts = []
         metadata = {"pages": 0, "extraction_method": "pypdf2"}
         
         try:
@@ -72,7 +179,7 @@ class AcademicPDFProcessor:
                         page_text = page.extract_text()
                         if page_text:
                             page_text = self._clean_pdf_text(page_text)
-                            full_text += f"\n--- Page {page_num + 1} ---\n{page_text}\n"
+                            page_parts.append(f"\n--- Page {page_num + 1} ---\n{page_text}\n")
                     except Exception as e:
                         logger.warning(f"Failed to extract text from page {page_num + 1}: {e}")
                         continue
@@ -81,27 +188,23 @@ class AcademicPDFProcessor:
             logger.error(f"PyPDF2 extraction failed: {e}")
             raise
             
-        return full_text, metadata
+        return "".join(page_parts), metadata
     
     def _clean_pdf_text(self, text: str) -> str:
         """Clean common PDF extraction artifacts."""
         # Remove excessive whitespace
-        text = re.sub(r'\n\s*\n', '\n\n', text)
-        text = re.sub(r' +', ' ', text)
+        text = self._BLANK_LINES_RE.sub('\n\n', text)
+        text = self._SPACES_RE.sub(' ', text)
         
         # Fix common hyphenation issues
-        text = re.sub(r'(\w)-\s*\n\s*(\w)', r'\1\2', text)
+        text = self._HYPHENATION_RE.sub(r'\1\2', text)
         
-        # Remove page numbers and headers/footers (simple heuristic)
-        lines = text.split('\n')
-        cleaned_lines = []
-        
-        for line in lines:
-            line = line.strip()
-            # Skip likely page numbers or short headers/footers
-            if len(line) < 3 or line.isdigit() or re.match(r'^\d+\s*$', line):
-                continue
-            cleaned_lines.append(line)
+        # Remove page numbers and headers/footers (simple heuristic):
+        # skip short lines and bare page numbers
+        cleaned_lines = [
+            line for line in (l.strip() for l in text.split('\n'))
+            if len(line) >= 3 and not line.isdigit()
+        ]
         
         return '\n'.join(cleaned_lines)
     
@@ -119,8 +222,11 @@ class AcademicPDFProcessor:
                     current_content.append('')
                 continue
             
+            # Body text with punctuation can't be a title; skip the pattern tiers for it
+            maybe_title = self._NON_TITLE_CHAR_RE.search(line) is None
+            
             # Check for main sections
-            section_match = self._match_section_pattern(line, self.section_patterns)
+            section_match = maybe_title and self._match_section_pattern(line, self.section_regex)
             if section_match:
                 # Save previous section
                 if current_section:
@@ -138,7 +244,7 @@ class AcademicPDFProcessor:
                 continue
             
             # Check for subsections
-            subsection_match = self._match_section_pattern(line, self.subsection_patterns)
+            subsection_match = maybe_title and self._match_section_pattern(line, self.subsection_regex)
             if subsection_match and current_section:
                 # This is a subsection, add it to content with special formatting
                 current_content.append(f"\n## {subsection_match}\n")
@@ -160,12 +266,12 @@ class AcademicPDFProcessor:
         
         return sections
     
-    def _match_section_pattern(self, line: str, patterns: List[str]) -> Optional[str]:
-        """Check if line matches any section pattern."""
-        for pattern in patterns:
-            match = re.match(pattern, line, re.IGNORECASE)
-            if match:
-                return match.group(1).strip()
+    def _match_section_pattern(self, line: str, pattern: re.Pattern) -> Optional[str]:
+        """Check if line matches any of the fused section patterns."""
+        match = pattern.match(line)
+        if match:
+            # lastindex is the group of the alternative that matched
+            return match.group(match.lastindex).strip()
         return None
     
     def create_intelligent_chunks(self, sections: List[Dict[str, Any]], 
@@ -206,14 +312,13 @@ class AcademicPDFProcessor:
     
     def _split_long_section(self, content: str, title: str, max_size: int) -> List[str]:
         """Split long sections at natural boundaries."""
-        paragraphs = [p.strip() for p in content.split('\n\n') if p.strip()]
+        # Strip each paragraph once and keep its length alongside it
+        paragraphs = [(p, len(p)) for p in map(str.strip, content.split('\n\n')) if p]
         chunks = []
         current_chunk = []
         current_size = 0
         
-        for paragraph in paragraphs:
-            para_size = len(paragraph)
-            
+        for paragraph, para_size in paragraphs:
             if current_size + para_size > max_size and current_chunk:
                 # Save current chunk and start new one
                 chunks.append('\n\n'.join(current_chunk))
@@ -234,7 +339,7 @@ class AcademicPDFProcessor:
         logger.info(f"Processing PDF: {pdf_path}")
         
         # Extract text
-        text, metadata = self.extract_text_pdfplumber(pdf_path)
+        text, metadata = self.extract_text_pdfium(pdf_path)
         
         if not text.strip():
             raise ValueError(f"No text extracted from {pdf_path}")
@@ -261,9 +366,31 @@ class AcademicPDFProcessor:
         return chunks
 
 
-def process_whitepaper_pdf(pdf_path: str) -> List[Dict[str, Any]]:
+def _extract_pdfium_range(pdf_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """PDFium: extract cleaned text for pages [start, end). Runs inside a worker process."""
+    processor = AcademicPDFProcessor(page_workers=1)
+    pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        return processor._pdfium_page_texts(pdf, start, end)
+    finally:
+        pdf.close()
+
+
+def _extract_page_range(pdf_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """pdfplumber: extract cleaned text for pages [start, end). Runs inside a worker process."""
+    processor = AcademicPDFProcessor(page_workers=1)
+    page_texts = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for page_num in range(start, end):
+            page_text = processor._extract_page_text(pdf.pages[page_num], page_num)
+            if page_text:
+                page_texts.append((page_num, page_text))
+    return page_texts
+
+
+def process_whitepaper_pdf(pdf_path: str, page_workers: Optional[int] = None) -> List[Dict[str, Any]]:
     """Convenience function to process a single PDF."""
-    processor = AcademicPDFProcessor()
+    processor = AcademicPDFProcessor(page_workers=page_workers)
     return processor.process_pdf(pdf_path)
 
 
@@ -0,0 +1,108 @@
+"""
+Speculative next-turn retrieval for conversations.
+
+After a turn is answered, the conversation's recent question embeddings are
+extrapolated one step along their trajectory on the unit sphere: a decayed
+mean gives the current topic centre C, the latest movement (momentum) is
+projected onto the tangent plane at C, and C is walked a small angle along
+that direction. Retrieval for the predicted point runs in the background and
+is kept per conversation for a short TTL. The next question reuses those
+results only if its embedding lands close to the prediction; otherwise live
+retrieval runs as usual. Prefetched results are consumed by the next turn and
+re-ranked for its actual question.
+"""
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+from cache import AnswerCache
+
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "false").lower() == "true"
+PREFETCH_TTL = float(os.getenv("PREFETCH_TTL", "300"))  # seconds
+PREFETCH_HISTORY = int(os.getenv("PREFETCH_HISTORY", "5"))  # turns kept per conversation
+PREFETCH_DECAY = float(os.getenv("PREFETCH_DECAY", "0.7"))  # weight of older turns in the topic centre
+PREFETCH_STEP = float(os.getenv("PREFETCH_STEP", "0.2"))  # radians walked along the trajectory
+PREFETCH_MIN_SIMILARITY = float(os.getenv("PREFETCH_MIN_SIMILARITY", "0.9"))  # cosine needed to use a prefetch
+PREFETCH_MAX_CONVERSATIONS = int(os.getenv("PREFETCH_MAX_CONVERSATIONS", "1000"))
+
+
+def _normalize(vector: np.ndarray) -> Optional[np.ndarray]:
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else None
+
+
+def predict_next(embeddings: List[np.ndarray], decay: float = PREFETCH_DECAY,
+                 step: float = PREFETCH_STEP) -> Optional[np.ndarray]:
+    """Extrapolate the next unit embedding from a conversation's (unit) question embeddings."""
+    if not embeddings:
+        return None
+    n = len(embeddings)
+    weights = decay ** np.arange(n - 1, -1, -1, dtype="float32")  # newest turn weighs most
+    centre = _normalize(np.tensordot(weights, np.stack(embeddings), axes=1))
+    if centre is None:
+        return None
+    if n < 2:
+        return centre
+
+    # Momentum of the last move, projected onto the tangent plane at the centre
+    momentum = embeddings[-1] - embeddings[-2]
+    direction = _normalize(momentum - np.dot(momentum, centre) * centre)
+    if direction is None:
+        return centre
+    # Geodesic step from the centre towards where the conversation is heading
+    return (np.cos(step) * centre + np.sin(step) * direction).astype("float32")
+
+
+class Prefetcher:
+    """Per-conversation question trajectories and the retrieval prefetched from them."""
+
+    def __init__(self, maxsize: int = PREFETCH_MAX_CONVERSATIONS, ttl: float = PREFETCH_TTL):
+        self._trajectories = AnswerCache(maxsize, ttl)
+        self._results = AnswerCache(maxsize, ttl)
+
+    def take(self, conversation_id: str, query_embedding: Optional[np.ndarray]) -> Optional[List[Dict[str, Any]]]:
+        """Prefetched results for this conversation, if the new question is close to the prediction.
+
+        A prefetch is only offered to the turn right after it was made (it is consumed either way).
+        """
+        entry = self._results.pop(conversation_id)
+        if query_embedding is None:
+            return None
+        if entry is None:
+            return None
+        predicted, results = entry
+        query = _normalize(np.asarray(query_embedding, dtype="float32").ravel())
+        if query is None or float(np.dot(query, predicted)) < PREFETCH_MIN_SIMILARITY:
+            return None
+        return results
+
+    async def prefetch(self, conversation_id: str, question: str, query_embedding: Optional[np.ndarray],
+                       retrieve: Callable[[str, np.ndarray], Awaitable[List[Dict[str, Any]]]]):
+        """Record this turn and retrieve for the predicted next one (run after the response is sent)."""
+        if query_embedding is None:
+            return
+        embedding = _normalize(np.asarray(query_embedding, dtype="float32").ravel())
+        if embedding is None:
+            return
+        trajectory = (self._trajectories.get(conversation_id) or []) + [embedding]
+        trajectory = trajectory[-PREFETCH_HISTORY:]
+        self._trajectories.set(conversation_id, trajectory)
+
+        # Whatever happens below, an older prefetch must not be served to a later turn
+        self._results.delete(conversation_id)
+        predicted = predict_next(trajectory)
+        if predicted is None:
+            return
+        try:
+            # No query text: candidates are picked without query-dependent boosts and
+            # re-ranked for the actual next question when taken
+            results = await retrieve("", predicted)
+        except Exception as e:
+            print(f"⚠️ Prefetch failed for {conversation_id}: {e}")
+            return
+        if results:
+            self._results.set(conversation_id, (predicted, results))
+
+
+prefetcher = Prefetcher()
@@ -0,0 +1,158 @@
+"""
+In-memory conversation history for prompt building.
+
+Each conversation keeps its committed history (role/content messages exactly as
+sent to the LLM) in a PromptManager. Turns are appended as deltas instead of
+re-reading and reassembling the history from SQLite on every /ask, so the
+history prefix stays byte-identical from turn to turn and provider-side prefix
+caching keeps hitting. When the history grows past PROMPT_HISTORY_TOKENS it is
+compacted once, down to the most recent messages that fit in
+PROMPT_HISTORY_KEEP_TOKENS, which starts a new stable prefix.
+
+The history's digest (conversation_prefix_hash, which scopes the response
+caches) is kept up to date incrementally instead of rehashing every turn.
+
+SQLite stays the record of the conversation; managers are hydrated from it on
+first use and dropped when the conversation is deleted. Each manager remembers
+how many stored messages it reflects (`synced`); a turn that finds a different
+count in the database (another worker or writer touched the conversation, or a
+save failed) rehydrates instead of building on a stale history.
+"""
+import hashlib
+import os
+import threading
+from typing import Callable, Dict, List, Optional
+
+from cache import AnswerCache, update_context_hash
+
+PROMPT_HISTORY_TOKENS = int(os.getenv("PROMPT_HISTORY_TOKENS", "3000"))  # compact above this
+PROMPT_HISTORY_KEEP_TOKENS = int(os.getenv("PROMPT_HISTORY_KEEP_TOKENS", "1500"))  # keep this much after compacting
+PROMPT_HISTORY_HYDRATE = int(os.getenv("PROMPT_HISTORY_HYDRATE", "20"))  # most recent messages loaded from SQLite
+PROMPT_MANAGER_TTL = float(os.getenv("PROMPT_MANAGER_TTL", "3600"))  # seconds
+PROMPT_MANAGER_MAX = int(os.getenv("PROMPT_MANAGER_MAX", "1000"))  # conversations kept in memory
+HYDRATE_LOCK_STRIPES = 64  # concurrent first requests to one conversation hydrate once
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English text)."""
+    return len(text) // 4 + 1
+
+
+class PromptManager:
+    """Committed, append-only history of one conversation."""
+
+    def __init__(self, messages: Optional[List[Dict[str, str]]] = None,
+                 max_tokens: int = PROMPT_HISTORY_TOKENS, keep_tokens: int = PROMPT_HISTORY_KEEP_TOKENS):
+        self.max_tokens = max_tokens
+        self.keep_tokens = keep_tokens
+        self._messages: List[Dict[str, str]] = []
+        self._tokens = 0
+        for message in messages or ():
+            self._messages.append({"role": message["role"], "content": message["content"]})
+            self._tokens += estimate_tokens(message["content"])
+        self._compact()
+        self._rehash()
+        self.synced = 0  # stored messages this history reflects
+
+    @property
+    def tokens(self) -> int:
+        return self._tokens
+
+    def prefix_hash(self) -> str:
+        """conversation_prefix_hash() of the committed history, without rehashing it."""
+        return self._hash.hexdigest() if self._messages else ""
+
+    def messages(self) -> List[Dict[str, str]]:
+        """The committed history (a new list; the message dicts are shared and must not be mutated)."""
+        return list(self._messages)
+
+    def append(self, message: Dict[str, str]):
+        """Commit one message, compacting if the history is over budget."""
+        message = {"role": message["role"], "content": message["content"]}
+        self._messages.append(message)
+        self._tokens += estimate_tokens(message["content"])
+        update_context_hash(self._hash, [message])
+        if self._compact():
+            self._rehash()
+
+    def discard_last(self, message: Dict[str, str]) -> bool:
+        """Take back the last committed message (a turn that never finished); False if it isn't the last one."""
+        if not self._messages or self._messages[-1] != {"role": message["role"], "content": message["content"]}:
+            return False
+        removed = self._messages.pop()
+        self._tokens -= estimate_tokens(removed["content"])
+        self._rehash()
+        return True
+
+    def _rehash(self):
+        self._hash = hashlib.blake2b(digest_size=16)
+        update_context_hash(self._hash, self._messages)
+
+    def _compact(self) -> bool:
+        """Drop old messages if over budget; True if the history changed."""
+        if self._tokens <= self.max_tokens:
+            return False
+        # Drop the oldest messages in one go, so the new prefix then stays stable for many turns
+        kept, tokens = len(self._messages), 0
+        while kept > 0:
+            cost = estimate_tokens(self._messages[kept - 1]["content"])
+            if tokens + cost > self.keep_tokens:
+                break
+            tokens += cost
+            kept -= 1
+        # Never start the history on an assistant reply
+        while kept < len(self._messages) and self._messages[kept]["role"] == "assistant":
+            tokens -= estimate_tokens(self._messages[kept]["content"])
+            kept += 1
+        dropped = kept
+        self._messages = self._messages[dropped:]
+        self._tokens = tokens
+        print(f"🗜️ Compacted conversation history: dropped {dropped} messages (~{tokens} tokens kept)")
+        return True
+
+
+class PromptManagers:
+    """PromptManager per conversation id, hydrated from the database on first use."""
+
+    def __init__(self, maxsize: int = PROMPT_MANAGER_MAX, ttl: float = PROMPT_MANAGER_TTL):
+        self._managers = AnswerCache(maxsize, ttl)
+        self._locks = [threading.Lock() for _ in range(HYDRATE_LOCK_STRIPES)]
+
+    def get(self, conversation_id: str) -> Optional[PromptManager]:
+        """The conversation's manager; using it keeps an active conversation from expiring."""
+        manager = self._managers.get(conversation_id)
+        if manager is not None:
+            self._managers.set(conversation_id, manager)
+        return manager
+
+    def current(self, conversation_id: str, message_count: int) -> Optional[PromptManager]:
+        """The manager, if it reflects exactly the message_count messages stored for the conversation."""
+        manager = self.get(conversation_id)
+        return manager if manager is not None and manager.synced == message_count else None
+
+    def hydrate(self, conversation_id: str, message_count: int,
+                load_context: Callable[..., List[Dict[str, str]]]) -> PromptManager:
+        """Build (and keep) the manager for a conversation from its stored history. Blocking.
+
+        Runs once per conversation at a time: a caller that waited on the lock gets the
+        manager the first one built, so appends made to it meanwhile are not lost.
+        """
+        with self._locks[hash(conversation_id) % HYDRATE_LOCK_STRIPES]:
+            manager = self.current(conversation_id, message_count)
+            if manager is None:
+                manager = PromptManager(load_context(conversation_id, max_messages=PROMPT_HISTORY_HYDRATE))
+                manager.synced = message_count
+                self._managers.set(conversation_id, manager)
+            return manager
+
+    def saved(self, conversation_id: str, message_count: int):
+        """Record that message_count more messages of the conversation were stored."""
+        manager = self._managers.get(conversation_id)
+        if manager is not None:
+            manager.synced += message_count
+
+    def forget(self, conversation_id: str):
+        self._managers.delete(conversation_id)
+
+
+managers = PromptManagers()
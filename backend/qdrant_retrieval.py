@@ -4,40 +4,51 @@ Qdrant-based retrieval functions for the backend
 import sys
 sys.path.append('db')
 
-from db.qdrant_utils import client, COLLECTION_NAME, search_embedding, get_collection_info
+from db.qdrant_utils import client, COLLECTION_NAME, search_embedding, search_embeddings_batch, get_collection_info
 from openai import OpenAI
-from config import OPENAI_API_KEY
+from config import OPENAI_API_KEY, EMBEDDING_MODEL, EMBEDDING_KWARGS
+from core import embed_query, embed_queries
 import numpy as np
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 openai_client = OpenAI(api_key=OPENAI_API_KEY)
 
-def retrieve_from_qdrant(query: str, k: int = 5) -> List[Dict[str, Any]]:
+def retrieve_from_qdrant(query: str, k: int = 5, query_embedding: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
     """Retrieve relevant chunks from Qdrant using semantic search."""
     
-    # Create query embedding
-    query_embedding = openai_client.embeddings.create(
-        model="text-embedding-ada-002",
-        input=query
-    ).data[0].embedding
+    # Create query embedding (skipped when the caller already has it; cached per query text)
+    if query_embedding is None:
+        query_embedding = embed_query(query)
     
     # Search in Qdrant
     results = search_embedding(np.array(query_embedding), top_k=k)
     
     # Convert to expected format
-    formatted_results = []
-    for hit in results:
-        result = {
-            "content": hit.payload.get("content", ""),
-            "source": hit.payload.get("source", ""),
-            "section": hit.payload.get("section", ""),
-            "filename": hit.payload.get("filename", ""),
-            "url": hit.payload.get("url", ""),
-            "score": hit.score
-        }
-        formatted_results.append(result)
+    return [_format_hit(hit) for hit in results]
+
+def retrieve_from_qdrant_batch(queries: List[str], k: int = 5,
+                               query_embeddings: Optional[List[Optional[np.ndarray]]] = None) -> List[List[Dict[str, Any]]]:
+    """Retrieve for several queries with one embeddings call and one Qdrant round trip."""
+    embeddings = list(query_embeddings) if query_embeddings is not None else [None] * len(queries)
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if missing:
+        for i, embedding in zip(missing, embed_queries([queries[i] for i in missing])):
+            embeddings[i] = embedding
     
-    return formatted_results
+    hit_lists = search_embeddings_batch(np.asarray(embeddings, dtype="float32"), top_k=k)
+    return [[_format_hit(hit) for hit in hits] for hits in hit_lists]
+
+def _format_hit(hit) -> Dict[str, Any]:
+    """Qdrant hit -> result dict in the shape used by the RAG pipeline."""
+    return {
+        "id": hit.id,
+        "content": hit.payload.get("content", ""),
+        "source": hit.payload.get("source", ""),
+        "section": hit.payload.get("section", ""),
+        "filename": hit.payload.get("filename", ""),
+        "url": hit.payload.get("url", ""),
+        "score": hit.score
+    }
 
 def add_new_embedding_to_qdrant(content: str, metadata: Dict[str, Any]) -> bool:
     """Add a new embedding to Qdrant collection."""
@@ -48,8 +59,9 @@ def add_new_embedding_to_qdrant(content: str, metadata: Dict[str, Any]) -> bool:
     try:
         # Create embedding for the new content
         embedding = openai_client.embeddings.create(
-            model="text-embedding-ada-002",
-            input=content
+            model=EMBEDDING_MODEL,
+            input=content,
+            **EMBEDDING_KWARGS
         ).data[0].embedding
         
         # Get next available ID
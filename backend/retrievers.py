@@ -0,0 +1,71 @@
+"""
+Vector-DB retrievers for the API.
+
+The API picks one Retriever at startup (Qdrant, or the local FAISS index as
+fallback) and every request goes through the same `search` call, so the
+answer paths don't branch on the vector DB.
+"""
+from typing import Any, Dict, List, Optional, Protocol, Tuple
+
+import numpy as np
+
+from batching import MicroBatcher
+from core import retrieve_batch
+from qdrant_retrieval import retrieve_from_qdrant_batch
+
+
+class Retriever(Protocol):
+    name: str
+
+    async def search(self, question: str, query_embedding: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """Retrieve chunks for a question (reusing its embedding when given)."""
+        ...
+
+    async def close(self):
+        ...
+
+
+class QdrantRetriever:
+    """Semantic search against the Qdrant collection; concurrent searches share one batch query."""
+
+    name = "qdrant"
+
+    def __init__(self, k: int = 10):
+        self.k = k
+        # Concurrent /ask requests share one embedding call and one query_batch_points round trip
+        self._batcher = MicroBatcher(self._search_batch)
+
+    def _search_batch(self, items: List[Tuple[str, Optional[np.ndarray]]]) -> List[List[Dict[str, Any]]]:
+        return retrieve_from_qdrant_batch([q for q, _ in items], self.k, [e for _, e in items])
+
+    async def search(self, question: str, query_embedding: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        return await self._batcher.submit((question, query_embedding))
+
+    async def close(self):
+        await self._batcher.close()
+
+
+class FaissRetriever:
+    """Search over the local FAISS index; concurrent searches are micro-batched."""
+
+    name = "faiss"
+
+    def __init__(self, index, metadata, k: int = 5):
+        self.index = index
+        self.metadata = metadata
+        self.k = k
+        # Concurrent /ask requests share one embedding call and one index.search
+        self._batcher = MicroBatcher(self._search_batch)
+
+    def _search_batch(self, items: List[Tuple[str, Optional[np.ndarray]]]) -> List[List[Dict[str, Any]]]:
+        """Batch function for the micro-batcher: items are (question, query_embedding or None)."""
+        return retrieve_batch([q for q, _ in items], self.index, self.metadata, self.k, [e for _, e in items])
+
+    async def search(self, question: str, query_embedding: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        if self.index is None or self.metadata is None:
+            print("❌ FAISS index not loaded")
+            return []
+        return await self._batcher.submit((question, query_embedding))
+
+    async def close(self):
+        await self._batcher.close()
@@ -59,6 +59,15 @@ from db.queue_manager import DatabaseQueueManager
 db_queue = DatabaseQueueManager()
 
 
+# Markdown patterns stripped from replies (pattern, replacement), applied in order
+_MARKDOWN_PATTERNS = [
+    (re.compile(r"(\*\*|__)(.*?)\1"), r"\2"),  # bold
+    (re.compile(r"(\*|_)(.*?)\1"), r"\2"),  # italics
+    (re.compile(r"\[([^\]]+)\]\([^)]+\)"), r"\1"),  # links
+    (re.compile(r"`([^`]+)`"), r"\1"),  # inline code
+]
+
+
 def _strip_markdown_emphasis(text: str) -> str:
     """Remove common Markdown formatting for Twitter plain-text output.
 
@@ -67,13 +76,8 @@ def _strip_markdown_emphasis(text: str) -> str:
     - Inline code ticks: `code` -> code
     """
     try:
-        # Bold/italics
-        text = re.sub(r"(\*\*|__)(.*?)\1", r"\2", text)
-        text = re.sub(r"(\*|_)(.*?)\1", r"\2", text)
-        # Links
-        text = re.sub(r"\[([^\]]+)\]\([^)]+\)", r"\1", text)
-        # Inline code
-        text = re.sub(r"`([^`]+)`", r"\1", text)
+        for pattern, replacement in _MARKDOWN_PATTERNS:
+            text = pattern.sub(replacement, text)
         return text
     except Exception:
         return text